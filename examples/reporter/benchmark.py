@@ -0,0 +1,175 @@
+""" A benchmark of the cost of `runai.reporter` for a training loop
+
+Starts a local stand-in for the Prometheus Pushgateway and drives the reporter from one or many processes.
+Reports the enqueue latency percentiles (the time the training loop spends in each report), the end-to-end
+delivery latency (from reporting until the stand-in received the value), the pushes per second and the CPU time
+of the reporting workers.
+
+usage: python examples/reporter/benchmark.py [--rate 1000] [--duration 10] [--processes 1] [--backend process]
+"""
+
+import argparse
+import http.server
+import multiprocessing
+import os
+import resource
+import threading
+import time
+
+import runai.reporter
+
+SENT_METRIC = 'benchmark_sent'
+
+class Gateway(http.server.ThreadingHTTPServer):
+    """ A stand-in for the Pushgateway that records the pushes it receives """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super(Gateway, self).__init__(('127.0.0.1', 0), Handler)
+        self.lock = threading.Lock()
+        self.pushes = 0
+        self.bytes = 0
+        self.connections = 0
+        self.latencies = []
+
+    def process_request(self, request, client_address):
+        with self.lock:
+            self.connections += 1
+        super(Gateway, self).process_request(request, client_address)
+
+    @property
+    def url(self):
+        return 'http://%s:%d' % self.server_address
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_POST(self):
+        now = time.time()
+        data = self.rfile.read(int(self.headers['Content-Length'])).decode('utf-8')
+
+        # the drivers report the time of sending as the value of a dedicated metric
+        latencies = [now - float(line.rsplit(' ', 1)[1]) for line in data.splitlines() if line.startswith(runai.reporter.report_promethues.REPORTER_PUSH_GATEWAY_METRIC_PREFIX + '_' + SENT_METRIC)]
+
+        with self.server.lock:
+            self.server.pushes += 1
+            self.server.bytes += len(data)
+            self.server.latencies.extend(latencies)
+
+        self.send_response(200)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_PUT = do_POST
+
+    def log_message(self, *args):
+        pass
+
+def drive(args, index, results):
+    # every driver process is a separate pod in the Pushgateway
+    os.environ[runai.reporter.report_promethues.GROUPING_KEY] = 'benchmark-%d' % index
+
+    reporter = runai.reporter.Reporter(backend=args.backend, maxsize=args.maxsize,
+                                       overflow=runai.reporter.Overflow[args.overflow])
+    reporter.start(daemon=False)
+
+    latencies = []
+    interval = 1. / args.rate if args.rate > 0 else 0
+    start = time.time()
+    cpu = time.process_time()
+    step = 0
+
+    while time.time() - start < args.duration:
+        before = time.perf_counter()
+
+        if args.api == 'single':
+            reporter.reportMetric('step', step)
+            reporter.reportMetric('loss', 1. / (step + 1))
+            reporter.reportMetric(SENT_METRIC, time.time())
+        else:
+            reporter.report_many(metrics={ 'step': step, 'loss': 1. / (step + 1), SENT_METRIC: time.time() })
+
+        latencies.append(time.perf_counter() - before)
+        step += 1
+
+        if interval > 0:
+            # sleep until the next report is due, as a training step would take
+            delay = start + step * interval - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+    finish = time.perf_counter()
+    reporter.finish()
+    finish = time.perf_counter() - finish
+
+    if reporter.backend is runai.reporter.Backend.process:
+        worker = resource.getrusage(resource.RUSAGE_CHILDREN)
+        worker = worker.ru_utime + worker.ru_stime
+    else:
+        worker = None # the worker thread is counted in the CPU time of this process
+
+    results.put(dict(
+        latencies=latencies,
+        steps=step,
+        finish=finish,
+        cpu=time.process_time() - cpu,
+        worker=worker,
+        counters=dict(dropped=reporter.counters.dropped, coalesced=reporter.counters.coalesced, pushed=reporter.counters.pushed),
+    ))
+
+def percentiles(values, scale=1e6, unit='us', ps=(50, 90, 99, 100)):
+    values = sorted(values)
+    if len(values) == 0:
+        return 'n/a'
+
+    return ' '.join('p%d=%.1f%s' % (p, values[min(len(values) - 1, len(values) * p // 100)] * scale, unit) for p in ps)
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the cost of runai.reporter')
+    parser.add_argument('--rate', type=float, default=1000, help='training steps per second per process (0 for as fast as possible)')
+    parser.add_argument('--duration', type=float, default=10, help='seconds')
+    parser.add_argument('--processes', type=int, default=1, help='number of reporting processes')
+    parser.add_argument('--backend', choices=[backend.value for backend in runai.reporter.Backend], default='process')
+    parser.add_argument('--api', choices=['single', 'many'], default='single', help='report every metric separately or all at once')
+    parser.add_argument('--maxsize', type=int, default=0, help='queue size (0 for unbounded)')
+    parser.add_argument('--overflow', choices=[overflow.name for overflow in runai.reporter.Overflow], default='drop_oldest')
+    args = parser.parse_args()
+
+    gateway = Gateway()
+    threading.Thread(target=gateway.serve_forever, daemon=True).start()
+    os.environ[runai.reporter.report_promethues.GATEWAY_URL_KEY] = gateway.url
+
+    results = multiprocessing.Queue()
+    drivers = [multiprocessing.Process(target=drive, args=(args, index, results)) for index in range(args.processes)]
+
+    start = time.time()
+    for driver in drivers:
+        driver.start()
+
+    results = [results.get() for _ in drivers]
+
+    for driver in drivers:
+        driver.join()
+
+    elapsed = time.time() - start
+    gateway.shutdown()
+
+    steps = sum(result['steps'] for result in results)
+    latencies = [latency for result in results for latency in result['latencies']]
+
+    print('Steps:              %d (%.0f/sec)' % (steps, steps / elapsed))
+    print('Enqueue latency:    %s' % percentiles(latencies))
+    print('Delivery latency:   %s' % percentiles(gateway.latencies, scale=1e3, unit='ms'))
+    print('Pushes:             %d (%.1f/sec, %.1f KB/push) over %d connection(s)' % (gateway.pushes, gateway.pushes / elapsed, gateway.bytes / 1024. / max(1, gateway.pushes), gateway.connections))
+    print('Finish latency:     %s' % percentiles([result['finish'] for result in results], scale=1e3, unit='ms'))
+    print('Process CPU:        %.2f sec' % sum(result['cpu'] for result in results))
+
+    if all(result['worker'] is not None for result in results):
+        print('Worker CPU:         %.2f sec' % sum(result['worker'] for result in results))
+
+    for counter in ['dropped', 'coalesced', 'pushed']:
+        print('Reports %-11s %d' % (counter + ':', sum(result['counters'][counter] for result in results)))
+
+if __name__ == '__main__':
+    main()
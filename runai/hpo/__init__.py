@@ -1,30 +1,108 @@
+import atexit
+import copy
 import datetime
 import enum
-import itertools
 import os
 import random
 import signal
 import sys
-
-import yaml
+import time
+import uuid
 
 import runai.utils
 
+from . import analytics
+from . import distributions
+from . import halving
+from . import leases
+from .analytics import Results
+from .backend import Backend, YAML
+from .checkpoint import Checkpointer
+from .distributions import Distribution, Uniform, LogUniform, IntRange, Categorical
+from .journal import Journal
+from .sampling import Sampler
+from .sqlite import SQLite
+from .tpe import TPE
+
 class Status:
     Unassigned = 'unassigned'
     Assigned = 'assigned'
     Preempted = 'preempted'
+    Stopped = 'stopped' # stopped early by the strategy
 
 class Strategy(enum.Enum):
     GridSearch = 0
     RandomSearch = 1
+    SuccessiveHalving = 2
+    TPE = 3
+
+LEASE = 300 # seconds after which an experiment whose worker stopped renewing its lease is continued by another worker
+CHECKPOINT_TIMEOUT = 20 # seconds to wait for checkpoints to be written upon preemption
+
+BACKENDS = dict(
+    yaml=YAML,
+    journal=Journal,
+    sqlite=SQLite,
+)
+
+class Buffer(object):
+    """ Reports that were not yet written to the state """
+
+    def __init__(self, every, interval):
+        self.every = every
+        self.interval = interval
+        self.reports = [] # (id, report) tuples
+        self.time = time.time() # of the last flush
+
+    def full(self):
+        """ Returns whether the reports should be flushed """
+        return (self.every is not None and len(self.reports) >= self.every) or \
+               (self.interval is not None and time.time() - self.time >= self.interval)
+
+    def clear(self):
+        """ Called once the reports were written """
+        self.reports = []
+        self.time = time.time()
+
+def now():
+    return datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+
+def _size(values):
+    """ Returns the number of combinations in a grid """
+    size = 1
+    for choices in values:
+        size *= len(choices)
+    return size
+
+def _combination(parameters, values, index):
+    """ Returns the configuration at an index of a grid (in the order of `itertools.product`)
+
+    The index is decoded as a mixed-radix number whose digits are the indices of the values of every parameter,
+    with the last parameter being the least significant one.
+    """
+    config = {}
+    for parameter, choices in reversed(list(zip(parameters, values))):
+        index, digit = divmod(index, len(choices))
+        config[parameter] = choices[digit]
+    return { parameter: config[parameter] for parameter in parameters }
 
-def init(root, subdir=None):
+def init(root, subdir=None, backend='yaml', flush_every=1, flush_interval=None, lease=LEASE):
     """ Initialize Run:AI HPO Assistance
 
     arguments:
       - root: The root shared directory (most commonly over NFS). The root directory must exist.
       - subdir (optional): If passed, a subdirectory with this name will be created under `root`.
+      - backend (optional): How the experiment state is stored; one of:
+          'yaml' (default) - a single YAML file (runai.yaml) that is rewritten upon every change
+          'journal' - changes are appended to a journal (runai.journal) that is periodically compacted into runai.yaml
+          'sqlite' - an SQLite database (runai.sqlite) with indexed experiments; an existing runai.yaml is migrated into it
+        All workers of an experiment must use the same backend.
+      - flush_every (optional): Reports are buffered and written to the state once this many were reported (defaults to 1; i.e. upon every report).
+      - flush_interval (optional): If passed, buffered reports are also written once this many seconds passed since they were last written.
+        Buffered reports are written anyway upon `flush`, preemption and exit.
+      - lease (optional): Workers renew the lease of their experiment (by touching a file under 'leases') in the background.
+        An experiment whose lease was not renewed for this many seconds (e.g. its worker was killed by SIGKILL) is continued
+        by the next worker, as if it was preempted. Pass `None` to disable.
     """
 
     if subdir is not None:
@@ -36,151 +114,546 @@ def init(root, subdir=None):
             runai.utils.log.debug('Created experiment directory at %s', root)
         except expected: pass # another experiment has already created it
 
-    flock = runai.utils.Flock(os.path.join(root, 'runai.yaml.lock'))
-    path = os.path.join(root, 'runai.yaml')
+    if backend not in BACKENDS:
+        raise ValueError('Unrecognized HPO backend %s' % backend)
+
+    backend = BACKENDS[backend](root)
+
+    # reports of a previous initialization should be written to its own state
+    flush()
 
     # place variables in this module for future use
-    setattr(sys.modules[__name__], 'flock', flock)
-    setattr(sys.modules[__name__], 'path', path)
+    setattr(sys.modules[__name__], 'backend', backend)
+    setattr(sys.modules[__name__], 'buffer', Buffer(flush_every, flush_interval))
+    setattr(sys.modules[__name__], 'lease', lease)
+    setattr(sys.modules[__name__], 'worker', uuid.uuid4().hex) # marks the experiments that are assigned to this worker
 
     def handler(signum, frame):
         runai.utils.log.warning('Experiment was preempted (received SIGTERM)')
 
-        experiment = getattr(sys.modules[__name__], 'experiment', None)
-        if experiment:
-            id = experiment['id']
-            runai.utils.log.debug('Marking experiment #%d as preempted in YAML', id)
+        # all experiments that were picked by this worker (and are not done yet)
+        ids = getattr(sys.modules[__name__], 'claimed', [])
+        if ids:
+            # the checkpoint should be written before another worker could continue the experiment
+            if not _wait(CHECKPOINT_TIMEOUT):
+                runai.utils.log.warning('Timed out waiting for the checkpoints of experiments %s', ids)
 
-            with flock:
-                with open(path, 'r') as f:
-                    data = yaml.load(f, Loader=yaml.FullLoader)
+            _release()
 
-                experiments = [e for e in data['experiments'] if e['id'] == id]
-                assert len(experiments) == 1, 'Could not find experiment #%d in YAML' % id
-                experiment = experiments[0]
+            with backend:
+                _flush(backend)
 
-                # mark the experiment as preempted
-                experiment['status'] = Status.Preempted
+                for id in ids:
+                    assert backend.experiment(id) is not None, 'Could not find experiment #%d' % id
 
-                # set the experiment and the global last modification times to now
-                now = datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-                experiment['modificationTime'] = now
-                data['modificationTime'] = now
+                    # mark the experiment as preempted (unless it was stopped, and should not be continued, or was reclaimed
+                    # by another worker) and set the experiment and the global last modification times to now
+                    if backend.experiment(id)['status'] == Status.Assigned and _owned(backend.experiment(id)):
+                        runai.utils.log.debug('Marking experiment #%d as preempted', id)
+                        modificationTime = now()
+                        backend.update(id, status=Status.Preempted, modificationTime=modificationTime)
+                        backend.set('modificationTime', modificationTime)
 
-                # rewrite the YAML
-                with open(path, 'w') as f:
-                    yaml.dump(data, f)
+            getattr(sys.modules[__name__], 'buffer').clear()
 
         # terminate the process (as it's currently in teardown)
         exit(1)
 
     signal.signal(signal.SIGTERM, handler)
 
-def pick(grid, strategy):
-    flock = getattr(sys.modules[__name__], 'flock')
-    path = getattr(sys.modules[__name__], 'path')
+def pick(grid, strategy, metric=None, mode='max', eta=3, min_epochs=1, seed=None):
+    """ Pick a configuration for this experiment
+
+    arguments:
+      - grid: A dictionary of the possible values of every hyperparameter; either a list or a distribution
+        (Uniform, LogUniform, IntRange or Categorical). Grid search supports only lists, IntRange and Categorical.
+      - strategy: One of:
+          Strategy.GridSearch - iterate through all configurations of the grid
+          Strategy.RandomSearch - randomize configurations (that were not picked before)
+          Strategy.SuccessiveHalving - randomize configurations, and stop experiments that are not in the top `1/eta`
+            of the experiments that reported `metric` at an epoch of `min_epochs * eta^k` (see `report`)
+          Strategy.TPE - propose configurations using a model (Tree-structured Parzen Estimator) of the reported `metric`
+            of previous experiments (see `runai.hpo.tpe`)
+      - metric (optional): The reported metric to optimize. Required for Strategy.SuccessiveHalving and Strategy.TPE.
+      - mode (optional): 'max' (default) if higher values of `metric` are better, 'min' otherwise.
+      - eta (optional): The reduction factor of Strategy.SuccessiveHalving.
+      - min_epochs (optional): The first epoch at which Strategy.SuccessiveHalving could stop experiments.
+      - seed (optional): The seed of the randomized configurations of Strategy.RandomSearch and Strategy.SuccessiveHalving,
+        which are then the same in every run of the experiment. A random seed is used if not passed.
+    The arguments of Strategy.SuccessiveHalving and the seed are stored by the first worker and are used by all workers.
+    """
+    experiments = pick_many(1, grid, strategy, metric, mode, eta, min_epochs, seed)
+    assert len(experiments) > 0, 'Could not find an unassigned HPO experiment'
+
+    return experiments[0]['config']
+
+def pick_many(n, grid, strategy, metric=None, mode='max', eta=3, min_epochs=1, seed=None):
+    """ Pick up to `n` experiments for this worker at once (taking the lock once), to be run one after another or concurrently
+
+    Returns a list of the experiments, each with its `id` and `config`, which could be shorter than `n` (or empty)
+    if there are no more experiments to pick. Reports of each experiment should pass its `id` to `report`.
+    The arguments are as of `pick`.
+    """
+    _validate(strategy, metric, mode, eta, min_epochs, grid)
+
+    backend = getattr(sys.modules[__name__], 'backend')
+    lease = getattr(sys.modules[__name__], 'lease', None)
+
+    # this worker no longer runs the previous experiments (if there were any)
+    _release()
+
+    experiments = []
+
+    with backend:
+        if not backend.created(): # the first experiment will create the state under the lock
+            runai.utils.log.debug('Creating HPO state at %s', backend.root)
+
+            backend.create(creationTime=now())
+
+            if strategy == Strategy.SuccessiveHalving:
+                backend.set('halving', dict(metric=metric, mode=mode, eta=eta, minEpochs=min_epochs))
 
-    with flock:
-        if not os.path.isfile(path): # the first experiment will create the YAML under the lock
-            runai.utils.log.debug('Creating HPO YAML file at %s', path)
+            if strategy == Strategy.GridSearch: # in grid search only the grid is stored; experiments are added once picked
+                backend.set('grid', dict(
+                    parameters=list(grid),
+                    values=[distributions.encode(grid[parameter]) for parameter in grid],
+                ))
+                backend.set('gridCursor', 0)
 
-            data = dict(
-                creationTime=datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
+        # the state now exists for sure
+
+        if lease is not None:
+            _reclaim(backend, lease)
+
+        for _ in range(n):
+            experiment = _select(backend, grid, strategy, metric, mode, seed)
+
+            if experiment is None:
+                break
+
+            # mark the experiment as assigned and set the experiment
+            # and the global last modification times to now
+            modificationTime = now()
+            backend.update(experiment['id'], status=Status.Assigned, modificationTime=modificationTime, worker=getattr(sys.modules[__name__], 'worker'))
+            backend.set('modificationTime', modificationTime)
+
+            experiments.append(copy.deepcopy(backend.experiment(experiment['id'])))
+
+        stored = backend.get('halving') if strategy == Strategy.SuccessiveHalving else None
+
+        if lease is not None: # leases are taken under the lock, so the experiments could not be reclaimed meanwhile
+            paths = [_lease_path(experiment['id']) for experiment in experiments]
+            for path in paths:
+                leases.take(path, getattr(sys.modules[__name__], 'worker'))
+
+    # save the experiments for later use
+    setattr(sys.modules[__name__], 'experiment', experiments[0] if len(experiments) > 0 else None)
+    setattr(sys.modules[__name__], 'claimed', [experiment['id'] for experiment in experiments])
+    setattr(sys.modules[__name__], 'epochs', { experiment['id']: _last(experiment) for experiment in experiments })
+    setattr(sys.modules[__name__], 'stopping', stored)
+
+    if lease is not None and len(experiments) > 0:
+        heartbeat = leases.Heartbeat(paths, lease / 3., getattr(sys.modules[__name__], 'worker'))
+        heartbeat.start()
+        setattr(sys.modules[__name__], 'heartbeat', heartbeat)
+
+    return experiments
+
+def trials(grid, strategy, batch=1, **kwargs):
+    """ Iterate the configurations of experiments to run one after another in this worker
+
+    Experiments are picked `batch` at a time (taking the lock once), and every experiment is considered done once the
+    next configuration is requested. Experiments that were picked but not run (e.g. upon `break`) are marked as preempted,
+    so other workers would run them.
+    The other arguments are as of `pick`.
+    """
+    while True:
+        remaining = pick_many(batch, grid, strategy, **kwargs)
+
+        if len(remaining) == 0:
+            return
+
+        try:
+            while len(remaining) > 0:
+                experiment = remaining.pop(0)
+                setattr(sys.modules[__name__], 'experiment', experiment)
+
+                yield experiment['config']
+
+                flush()
+                _release(experiment['id'])
+        finally:
+            if len(remaining) > 0:
+                _unclaim([experiment['id'] for experiment in remaining])
+
+def _validate(strategy, metric, mode, eta, min_epochs, grid):
+    if strategy in [Strategy.SuccessiveHalving, Strategy.TPE]:
+        if metric is None:
+            raise ValueError('A metric is required for strategy %s' % str(strategy))
+        if mode not in ['max', 'min']:
+            raise ValueError('Unrecognized mode %s' % mode)
+
+    if strategy == Strategy.SuccessiveHalving:
+        if eta < 2 or min_epochs < 1:
+            raise ValueError('Invalid successive halving arguments (eta=%s, min_epochs=%s)' % (eta, min_epochs))
+
+    if strategy == Strategy.GridSearch:
+        for parameter, values in grid.items():
+            if not hasattr(values, '__len__'):
+                raise ValueError('Values of %s could not be enumerated for grid search' % parameter)
+
+    if strategy not in list(Strategy):
+        raise ValueError('Unrecognized strategy %s' % str(strategy))
+
+def _select(backend, grid, strategy, metric, mode, seed):
+    """ Returns the next experiment to run according to a strategy, or `None` if there is none (called under the lock) """
+    if strategy == Strategy.GridSearch: # pick a preempted experiment or the next one in the grid
+        # experiments of states that were created with all of the grid in advance are still unassigned
+        experiment = backend.first([Status.Unassigned, Status.Preempted])
+
+        if experiment is None:
+            stored = backend.get('grid')
+            cursor = backend.get('gridCursor', 0)
+            values = [distributions.decode(values) for values in stored['values']] if stored is not None else []
+
+            if stored is None or cursor >= _size(values):
+                return None
+
+            experiment = dict(
+                id=cursor + 1,
+                status=Status.Unassigned,
+                config=_combination(stored['parameters'], values, cursor),
             )
+            backend.add(experiment)
+            backend.set('gridCursor', cursor + 1)
+
+        runai.utils.log.info('Picked %sHPO experiment #%d with configuration %s', ('preempted ' if experiment['status'] == Status.Preempted else ''), experiment['id'], experiment['config'])
+        return experiment
+
+    # continue a preempted experiment if there is one
+    experiment = backend.first([Status.Preempted])
+
+    if experiment is not None:
+        runai.utils.log.info('Continuing preempted HPO experiment #%d with configuration %s', experiment['id'], experiment['config'])
+        return experiment
+
+    if strategy in [Strategy.RandomSearch, Strategy.SuccessiveHalving]: # randomize a new one
+        if backend.get('seed') is None: # the first worker (also of states that were created without a seed) stores it
+            backend.set('seed', random.getrandbits(32) if seed is None else seed)
+
+        # the sampler is kept between picks of this process, and indexes only the experiments added since
+        sampler = getattr(sys.modules[__name__], 'sampler', None)
+        if sampler is None or not sampler.matches(backend.root, grid, backend.get('seed')):
+            sampler = Sampler(backend.root, grid, backend.get('seed'))
+            setattr(sys.modules[__name__], 'sampler', sampler)
+
+        sampler.observe(backend)
+
+        config, cursor = sampler.sample(backend.get('sampleCursor', 0))
+
+        if config is None:
+            runai.utils.log.info('All configurations of the HPO grid were picked')
+            return None
+
+        backend.set('sampleCursor', cursor)
+
+        experiment = dict(
+            id=backend.next_id(),
+            status=Status.Unassigned,
+            config=config,
+        )
+        runai.utils.log.info('Randomized HPO experiment #%d with configuration %s', experiment['id'], experiment['config'])
+    else: # propose a new one
+        # the model is kept between picks of this process, and observes only the reports added since
+        model = getattr(sys.modules[__name__], 'model', None)
+        if model is None or not model.matches(grid, metric, mode, backend.root):
+            model = TPE(grid, metric, mode, backend.root)
+            setattr(sys.modules[__name__], 'model', model)
+
+        model.observe(backend.experiments())
+
+        experiment = dict(
+            id=backend.next_id(),
+            status=Status.Unassigned,
+            config=model.suggest(),
+        )
+        runai.utils.log.info('Proposed HPO experiment #%d with configuration %s', experiment['id'], experiment['config'])
+
+    backend.add(experiment)
+    return experiment
+
+def _unclaim(ids):
+    """ Mark experiments that were picked but will not be run as preempted, so other workers would run them """
+    backend = getattr(sys.modules[__name__], 'backend')
+    _release()
+
+    with backend:
+        for id in ids:
+            backend.update(id, status=Status.Preempted, modificationTime=now())
+
+def _lease_path(id):
+    directory = os.path.join(getattr(sys.modules[__name__], 'backend').root, 'leases')
+
+    if not os.path.isdir(directory):
+        try:
+            os.mkdir(directory)
+        except OSError: pass # another worker has already created it
+
+    return os.path.join(directory, str(id))
+
+def _reclaim(backend, lease):
+    """ Mark experiments whose lease expired as preempted, so they would be continued (called under the lock) """
+    for id in leases.expired(os.path.join(backend.root, 'leases'), lease):
+        token = leases.owner(_lease_path(id))
+        if token is None:
+            continue # released meanwhile
+
+        experiment = backend.experiment(id)
+
+        if experiment is not None and experiment['status'] == Status.Assigned:
+            runai.utils.log.warning('Lease of HPO experiment #%d expired; marking it as preempted', id)
+
+            modificationTime = now()
+            backend.update(id, status=Status.Preempted, modificationTime=modificationTime)
+            backend.set('modificationTime', modificationTime)
+
+        leases.remove(_lease_path(id), token)
+
+def _release(id=None):
+    """ Stop renewing the lease of an experiment (or of all picked experiments if `None`) and release it """
+    heartbeat = getattr(sys.modules[__name__], 'heartbeat', None)
+    claimed = getattr(sys.modules[__name__], 'claimed', [])
+
+    if id is None:
+        if heartbeat is not None:
+            heartbeat.stop()
+            setattr(sys.modules[__name__], 'heartbeat', None)
+
+        setattr(sys.modules[__name__], 'claimed', [])
+    else:
+        if heartbeat is not None:
+            heartbeat.release(_lease_path(id))
+
+        setattr(sys.modules[__name__], 'claimed', [claim for claim in claimed if claim != id])
+
+def report(epoch, metrics, id=None):
+    """ Report metrics of an epoch of the experiment
+
+    Reports are buffered, and are written to the state according to `flush_every` and `flush_interval` of `init`.
+    Returns whether the experiment should stop (with Strategy.SuccessiveHalving; always `False` otherwise).
+
+    arguments:
+      - epoch: The epoch number.
+      - metrics: A dictionary of the metrics of the epoch.
+      - id (optional): The id of the experiment, if more than one was picked using `pick_many`; defaults to the picked experiment.
+    """
+    buffer = getattr(sys.modules[__name__], 'buffer')
+    id = getattr(sys.modules[__name__], 'experiment')['id'] if id is None else id
+    stored = getattr(sys.modules[__name__], 'stopping', None)
+
+    buffer.reports.append((id, dict(
+        epoch=epoch,
+        metrics=metrics,
+        reportTime=now(),
+    )))
+
+    getattr(sys.modules[__name__], 'epochs')[id] = epoch
+
+    if stored is not None and stored['metric'] in metrics and halving.milestone(epoch, stored['eta'], stored['minEpochs']):
+        # the decision is made under the same lock as writing the report, as other workers may decide at the same time
+        with getattr(sys.modules[__name__], 'backend') as backend:
+            _flush(backend)
+
+            # an experiment that was reclaimed by another worker should not be run by this one anymore
+            stop = _halve(backend, id, epoch, metrics[stored['metric']], stored) if _owned(backend.experiment(id)) else True
+
+        buffer.clear()
+        return stop
+
+    if buffer.full():
+        flush()
+
+    return False
+
+def _halve(backend, id, epoch, value, stored):
+    """ Record the value of an experiment at a rung and stop it if it is not promoted (called under the lock) """
+    rung = str(epoch)
+    values = [experiment['rungs'][rung] for experiment in backend.experiments() if experiment['id'] != id and rung in experiment.get('rungs', {})]
+
+    rungs = dict(backend.experiment(id).get('rungs', {}))
+    rungs[rung] = value
+    backend.update(id, rungs=rungs)
+
+    if halving.promoted(value, values, stored['mode'], stored['eta']):
+        runai.utils.log.debug('HPO experiment #%d was promoted at epoch %d (%s=%s)', id, epoch, stored['metric'], value)
+        return False
+
+    runai.utils.log.info('Stopping HPO experiment #%d at epoch %d (%s=%s)', id, epoch, stored['metric'], value)
+
+    modificationTime = now()
+    backend.update(id, status=Status.Stopped, modificationTime=modificationTime)
+    backend.set('modificationTime', modificationTime)
+
+    return True
+
+def flush():
+    """ Write the buffered reports to the state """
+    buffer = getattr(sys.modules[__name__], 'buffer', None)
+
+    if buffer is None or len(buffer.reports) == 0:
+        return
+
+    with getattr(sys.modules[__name__], 'backend') as backend:
+        _flush(backend)
+
+    buffer.clear()
+
+def _flush(backend):
+    """ Write the buffered reports using a backend (called under its lock) """
+    for id, report in getattr(sys.modules[__name__], 'buffer').reports:
+        experiment = backend.experiment(id)
+        assert experiment is not None, 'Could not find experiment #%d' % id
+
+        if not _owned(experiment):
+            runai.utils.log.warning('HPO experiment #%d is no longer assigned to this worker (its lease expired); dropping its report of epoch %s', id, report['epoch'])
+            continue
+
+        backend.report(id, report)
+
+def _owned(experiment):
+    """ Returns whether an experiment is still run by this worker (rather than reclaimed once its lease expired, and maybe picked by another worker) """
+    return experiment['status'] in [Status.Assigned, Status.Stopped] and experiment.get('worker') == getattr(sys.modules[__name__], 'worker', None)
+
+def _lost(id):
+    """ Returns whether the lease of an experiment is no longer held by this worker (i.e. it expired and was reclaimed) """
+    if getattr(sys.modules[__name__], 'lease', None) is None:
+        return False # experiments are never reclaimed without leases
+
+    return leases.owner(_lease_path(id)) != getattr(sys.modules[__name__], 'worker')
+
+def last_epoch(id=None):
+    """ Returns the last epoch reported by the experiment (e.g. before it was preempted), or `None` if it did not report yet
+
+    arguments:
+      - id (optional): The id of the experiment, if more than one was picked using `pick_many`; defaults to the picked experiment.
+    """
+    return getattr(sys.modules[__name__], 'epochs').get(_id(id))
+
+def _id(id):
+    """ Returns the id of an experiment, or of the picked experiment if `None` """
+    return getattr(sys.modules[__name__], 'experiment')['id'] if id is None else id
+
+def _last(experiment):
+    """ Returns the last epoch in the reports of an experiment, or `None` if there are none """
+    reports = experiment.get('reports', [])
+    return reports[-1]['epoch'] if len(reports) > 0 else None
+
+def checkpoint_path(id=None):
+    """ Returns the checkpoint directory of the experiment (under the experiment directory), which is kept when it is preempted and continued
+
+    arguments:
+      - id (optional): The id of the experiment, if more than one was picked using `pick_many`; defaults to the picked experiment.
+    """
+    path = os.path.join(getattr(sys.modules[__name__], 'backend').root, 'checkpoints', str(_id(id)))
+
+    if not os.path.isdir(path):
+        try:
+            os.makedirs(path)
+        except OSError: pass # another worker has already created it
+
+    return path
+
+def checkpoint(write, wait=False, id=None):
+    """ Write a checkpoint of the experiment in a background thread
+
+    Only the latest checkpoint is kept, and it could be found using `latest_checkpoint`.
+    Checkpoints are waited for upon preemption and exit.
+    As the checkpoint is written in the background, `write` should not use objects that training keeps changing
+    (e.g. it should use a copy of the weights).
+
+    arguments:
+      - write: A callable that writes the checkpoint into the directory that is passed to it.
+      - wait (optional): Wait until the checkpoint is written.
+      - id (optional): The id of the experiment, if more than one was picked using `pick_many`; defaults to the picked experiment.
+    """
+    id = _id(id)
+
+    if _lost(id):
+        runai.utils.log.warning('HPO experiment #%d is no longer assigned to this worker (its lease expired); skipping its checkpoint', id)
+        return
+
+    checkpointers = getattr(sys.modules[__name__], 'checkpointers', {}) # by the id of their experiment
+    setattr(sys.modules[__name__], 'checkpointers', checkpointers)
+
+    if id not in checkpointers:
+        # checkpoints of experiments that this worker no longer runs are waited for
+        for previous in [previous for previous in checkpointers if previous not in getattr(sys.modules[__name__], 'claimed', [])]:
+            checkpointers.pop(previous).wait()
+
+        checkpointers[id] = Checkpointer(checkpoint_path(id))
+
+    checkpointers[id].submit(write)
+
+    if wait:
+        checkpointers[id].wait()
+
+def latest_checkpoint(id=None):
+    """ Returns the directory of the latest checkpoint of the experiment, or `None` if there is none
+
+    arguments:
+      - id (optional): The id of the experiment, if more than one was picked using `pick_many`; defaults to the picked experiment.
+    """
+    return Checkpointer(checkpoint_path(id)).latest()
+
+def _wait(timeout=None):
+    """ Wait for the checkpoints that are being written (of all experiments); returns `False` upon timeout """
+    deadline = None if timeout is None else time.time() + timeout
+
+    for checkpointer in list(getattr(sys.modules[__name__], 'checkpointers', {}).values()):
+        if not checkpointer.wait(None if deadline is None else max(0, deadline - time.time())):
+            return False
+
+    return True
+
+def experiments(statuses=None):
+    """ Returns the experiments along with their configurations and reports
+
+    Takes a shared lock, so it could be called frequently (e.g. for monitoring) without slowing down workers.
+
+    arguments:
+      - statuses (optional): If passed, only experiments with one of these statuses are returned.
+    """
+    backend = getattr(sys.modules[__name__], 'backend')
+
+    with backend.shared():
+        if not backend.created():
+            return []
+
+        return copy.deepcopy(backend.experiments(statuses))
+
+def results(root, subdir=None):
+    """ Returns the results of an experiment as columnar tables (see `runai.hpo.analytics.Results`)
+
+    Results are kept between calls, and only reports that were added since the previous call are processed.
+    Could be called by any process (e.g. a notebook), without calling `init`.
+
+    arguments:
+      - root: The root shared directory, as passed to `init`.
+      - subdir (optional): The subdirectory of the experiment, as passed to `init`.
+    """
+    if subdir is not None:
+        root = os.path.join(root, subdir)
+
+    cache = getattr(sys.modules[__name__], 'cache', {})
+    setattr(sys.modules[__name__], 'cache', cache)
+
+    backend = analytics.detect(root)
+    if root not in cache or type(cache[root].backend) != type(backend): # e.g. the state was migrated to another backend
+        cache[root] = Results(backend)
+
+    cache[root].update()
+    return cache[root]
 
-            if strategy == Strategy.GridSearch: # in grid search we generate all experiments in advance
-                parameters = []
-                iterables = []
-                for parameter in grid:
-                    parameters.append(parameter)
-                    iterables.append(grid[parameter])
-
-                experiments = []
-                for combination in itertools.product(*iterables):
-                    experiment = dict(
-                        id=len(experiments) + 1,
-                        status=Status.Unassigned,
-                        config={ parameters[j]: combination[j] for j in range(len(parameters)) },
-                    )
-                    experiments.append(experiment)
-
-                data['experiments'] = experiments
-
-            with open(path, 'w') as f:
-                yaml.dump(data, f)
-
-        # the YAML file now exists for sure
-
-        with open(path, 'r') as f:
-            data = yaml.load(f, Loader=yaml.FullLoader)
-
-        if strategy == Strategy.GridSearch: # pick an unassigned or a preempted experiment
-            experiment = None
-            for prospect in data['experiments']:
-                if prospect['status'] in [Status.Unassigned, Status.Preempted]:
-                    experiment = prospect
-                    break
-            assert experiment is not None, 'Could not find an unassigned HPO experiment'
-            runai.utils.log.info('Picked %sHPO experiment #%d with configuration %s', ('preempted ' if experiment['status'] == Status.Preempted else ''), experiment['id'], experiment['config'])
-        elif strategy == Strategy.RandomSearch: # continue a preempted experiment or randomize a new one
-            if 'experiments' not in data:
-                data['experiments'] = []
-
-            # first check if there are any preempted experiments that should be continued
-            preempted = [experiment for experiment in data['experiments'] if experiment['status'] == Status.Preempted]
-
-            if len(preempted) > 0: # if there are, continue the first one
-                experiment = preempted[0]
-                runai.utils.log.info('Continuing preempted HPO experiment #%d with configuration %s', experiment['id'], experiment['config'])
-            else:
-                experiment = dict(
-                    id=1 if len(data['experiments']) == 0 else (max([experiment['id'] for experiment in data['experiments']]) + 1),
-                    config={ parameter: random.choice(grid[parameter]) for parameter in grid },
-                )
-                runai.utils.log.info('Randomized HPO experiment #%d with configuration %s', experiment['id'], experiment['config'])
-                data['experiments'].append(experiment)
-        else:
-            raise ValueError('Unrecognized strategy %s' % str(strategy))
-
-        # mark the experiment as assigned
-        experiment['status'] = Status.Assigned
-
-        # set the experiment and the global last modification times to now
-        now = datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S')
-        experiment['modificationTime'] = now
-        data['modificationTime'] = now
-
-        # rewrite the YAML
-        with open(path, 'w') as f:
-            yaml.dump(data, f)
-
-    # save the experiment for later use
-    setattr(sys.modules[__name__], 'experiment', experiment)
-
-    return experiment['config']
-
-def report(epoch, metrics):
-    flock = getattr(sys.modules[__name__], 'flock')
-    path = getattr(sys.modules[__name__], 'path')
-    id = getattr(sys.modules[__name__], 'experiment')['id']
-
-    with flock:
-        with open(path, 'r') as f:
-            data = yaml.load(f, Loader=yaml.FullLoader)
-
-        experiments = [e for e in data['experiments'] if e['id'] == id]
-        assert len(experiments) == 1, 'Could not find experiment #%d in YAML' % id
-        experiment = experiments[0]
-
-        if 'reports' not in experiment:
-            experiment['reports'] = []
-
-        experiment['reports'].append(dict(
-            epoch=epoch,
-            metrics=metrics,
-            reportTime=datetime.datetime.now().strftime('%d/%m/%Y %H:%M:%S'),
-        ))
-
-        # rewrite the YAML
-        with open(path, 'w') as f:
-            yaml.dump(data, f)
+atexit.register(flush)
+atexit.register(_release)
+atexit.register(_wait)
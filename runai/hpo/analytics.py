@@ -0,0 +1,196 @@
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .backend import YAML
+from .journal import Journal
+from .sqlite import SQLite
+
+def detect(root):
+    """ Returns the backend of an experiment directory by the files in it """
+    if os.path.isfile(os.path.join(root, 'runai.sqlite')):
+        return SQLite(root)
+
+    if os.path.isfile(os.path.join(root, 'runai.journal')):
+        return Journal(root)
+
+    return YAML(root)
+
+def _dtype(value):
+    if isinstance(value, (bool, int, float)):
+        return np.array(value).dtype
+
+    return np.dtype(object) # e.g. strings (which should not be truncated to a fixed length), lists and missing values
+
+class Column(object):
+    """ The values of a column, appended and updated in place
+
+    Kept in a NumPy array whose capacity is doubled once it is full (so appending takes amortized O(1)),
+    and whose type is widened as needed (e.g. to `object` once a value is missing); kept in a list if NumPy is not installed.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self._values = [] if np is None else None # the NumPy array is allocated upon the first value, by its type
+
+    def append(self, value):
+        if np is None:
+            self._values.append(value)
+        else:
+            if self._values is None:
+                self._values = np.empty(16, dtype=_dtype(value))
+            elif self.rows == len(self._values):
+                self._values = np.concatenate([self._values, np.empty(len(self._values), dtype=self._values.dtype)])
+
+            self._set(self.rows, value)
+
+        self.rows += 1
+
+    def __setitem__(self, index, value):
+        if np is None:
+            self._values[index] = value
+        else:
+            self._set(index, value)
+
+    def _set(self, index, value):
+        dtype = _dtype(value)
+
+        if self._values.dtype != dtype and self._values.dtype != object:
+            self._values = self._values.astype(object if dtype == object else np.promote_types(self._values.dtype, dtype))
+
+        try:
+            self._values[index] = value
+        except (OverflowError, TypeError, ValueError): # e.g. an integer that does not fit in 64 bits
+            self._values = self._values.astype(object)
+            self._values[index] = value
+
+    def values(self):
+        """ Returns the values; a view of the array (or a copy of the list) """
+        if np is None:
+            return list(self._values)
+
+        return np.empty(0) if self._values is None else self._values[:self.rows]
+
+class Table(object):
+    """ Columns of equal length, built a row at a time """
+
+    def __init__(self):
+        self.columns = {}
+        self.rows = 0
+
+    def _column(self, name):
+        if name not in self.columns: # a column that was not seen until now
+            column = Column()
+            for _ in range(self.rows):
+                column.append(None)
+            self.columns[name] = column
+
+        return self.columns[name]
+
+    def append(self, row):
+        for name in row:
+            self._column(name)
+
+        for name, column in self.columns.items():
+            column.append(row.get(name))
+
+        self.rows += 1
+
+    def set(self, index, row):
+        """ Update values of a row """
+        for name, value in row.items():
+            self._column(name)[index] = value
+
+    def arrays(self):
+        return { name: column.values() for name, column in self.columns.items() }
+
+class Results(object):
+    """ The results of an HPO experiment as columnar tables
+
+    - `trials`: a row per experiment with its `id`, `status`, the number of `epochs` it reported, its configuration
+      (a 'config.' column per hyperparameter) and its last reported metrics (a 'metric.' column per metric)
+    - `reports`: a row per report with the `id` of the experiment, the `epoch` and the metrics (a 'metric.' column per metric)
+
+    Columns are NumPy arrays if NumPy is installed, and lists otherwise.
+    Results are kept between calls of `runai.hpo.results`, and are updated in place: only reports that were added since
+    are read from the state (see `Backend.reports`) and are appended to the columns, and only rows of experiments
+    that were added or whose status changed are updated in `trials`.
+
+    arguments:
+      - backend: The backend of the experiment.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._trials = Table()
+        self._reports = Table()
+        self._rows = {} # the row of every experiment in `trials`, by its id
+        self._statuses = {} # the status of every experiment, by its id
+        self._epochs = {} # the number of reports of every experiment, by its id
+        self._cursor = None # of the reports that were read
+
+    def update(self):
+        """ Read the reports that were added (and the experiments that changed) since the last update """
+        with self.backend.shared():
+            if not self.backend.created():
+                return
+
+            experiments = self.backend.experiments(reports=False)
+            reports, self._cursor = self.backend.reports(self._cursor)
+
+        for experiment in experiments:
+            id = experiment['id']
+            status = experiment.get('status')
+
+            if id not in self._rows:
+                row = dict(id=id, status=status, epochs=0)
+                row.update(('config.%s' % parameter, value) for parameter, value in experiment.get('config', {}).items())
+
+                self._rows[id] = self._trials.rows
+                self._epochs[id] = 0
+                self._trials.append(row)
+            elif status != self._statuses[id]:
+                self._trials.set(self._rows[id], dict(status=status))
+
+            self._statuses[id] = status
+
+        last = {} # the last report of every experiment that reported
+        for id, report in reports:
+            row = dict(id=id, epoch=report.get('epoch'))
+            row.update(('metric.%s' % metric, value) for metric, value in report.get('metrics', {}).items())
+
+            self._reports.append(row)
+            self._epochs[id] += 1
+            last[id] = report
+
+        for id, report in last.items():
+            # the metrics of the last report replace all previous ones
+            row = { name: None for name in self._trials.columns if name.startswith('metric.') }
+            row.update(('metric.%s' % metric, value) for metric, value in report.get('metrics', {}).items())
+            row['epochs'] = self._epochs[id]
+
+            self._trials.set(self._rows[id], row)
+
+    def _table(self, name):
+        return (self._trials if name == 'trials' else self._reports).arrays()
+
+    @property
+    def trials(self):
+        return self._table('trials')
+
+    @property
+    def reports(self):
+        return self._table('reports')
+
+    def dataframe(self, table='trials'):
+        """ Returns a table ('trials' or 'reports') as a pandas DataFrame (requires pandas) """
+        import pandas
+
+        return pandas.DataFrame(self._table(table))
+
+    def to_parquet(self, path, table='trials'):
+        """ Write a table ('trials' or 'reports') to a Parquet file (requires pandas, and pyarrow or fastparquet) """
+        self.dataframe(table).to_parquet(path)
@@ -0,0 +1,324 @@
+import contextlib
+import json
+import os
+
+import yaml
+
+import runai.utils
+
+try: # prefer the C implementation (LibYAML) if available
+    from yaml import CSafeLoader as _Loader, CSafeDumper as _Dumper
+except ImportError:
+    from yaml import SafeLoader as _Loader, SafeDumper as _Dumper
+
+class Loader(_Loader):
+    pass
+
+class Dumper(_Dumper):
+    pass
+
+# tuples (e.g. in configurations) are kept as tuples, as they were by `yaml.dump` in previous versions
+Loader.add_constructor(u'tag:yaml.org,2002:python/tuple', lambda loader, node: tuple(loader.construct_sequence(node)))
+Dumper.add_representer(tuple, lambda dumper, data: dumper.represent_sequence(u'tag:yaml.org,2002:python/tuple', data))
+
+def _tagged(value):
+    if isinstance(value, tuple):
+        return { '__tuple__': [_tagged(item) for item in value] }
+
+    if isinstance(value, list):
+        return [_tagged(item) for item in value]
+
+    if isinstance(value, dict):
+        return { key: _tagged(item) for key, item in value.items() }
+
+    return value
+
+def _untagged(value):
+    return tuple(value['__tuple__']) if len(value) == 1 and '__tuple__' in value else value
+
+def dumps(value, **kwargs):
+    """ Returns the JSON representation of a value, keeping tuples (which JSON would turn into lists) as tuples """
+    return json.dumps(_tagged(value), **kwargs)
+
+def loads(data):
+    """ Returns a value from its representation by `dumps` """
+    return json.loads(data, object_hook=_untagged)
+
+def replace(path, data):
+    """ Replace the content of a file atomically
+
+    The data is written to a temporary file in the same directory, which then replaces the file.
+    Readers therefore see either the previous or the new content, and never a partially written file.
+    Should be called under the lock, as the temporary file is shared.
+    """
+    temp = path + '.tmp'
+
+    with open(temp, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+
+    os.replace(temp, path)
+
+class Backend(object):
+    """ A storage of the state of an HPO experiment (shared between all of its workers)
+
+    The state should be accessed only in a `with` block, which holds the lock of the experiment.
+    Changes are committed when the block ends successfully and are discarded otherwise.
+    Experiments returned by the backend should not be modified directly but only using `update` and `report`.
+    Read-only access should use a `with backend.shared()` block instead, which does not block other readers.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.flock = runai.utils.Flock(os.path.join(root, 'runai.yaml.lock'))
+        self.readonly = False # whether the current block is a shared one
+
+    def __enter__(self):
+        self.flock.acquire(shared=self.readonly)
+
+        try:
+            self.load()
+        except:
+            self.flock.release()
+            raise
+
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        try:
+            if exc_type is None:
+                self.commit()
+            else:
+                self.discard()
+        finally:
+            self.flock.release()
+
+    @contextlib.contextmanager
+    def shared(self):
+        """ A `with` block for read-only access to the state
+
+        Holds a shared lock, so readers (e.g. monitoring tools) do not block each other, and block workers only while reading.
+        The state must not be changed in the block.
+        """
+        self.readonly = True
+
+        try:
+            with self:
+                yield self
+        finally:
+            self.readonly = False
+
+    def load(self):
+        """ Load the state (called under the lock) """
+        raise NotImplementedError()
+
+    def commit(self):
+        """ Persist the changes made since the state was loaded (called under the lock) """
+        raise NotImplementedError()
+
+    def discard(self):
+        """ Discard the changes made since the state was loaded """
+        raise NotImplementedError()
+
+    def snapshot(self):
+        """ Returns the whole state as of the last commit (as stored in runai.yaml), or `None` if it was not created yet
+
+        Does not take the lock and could be called outside of a `with` block (e.g. by monitoring tools).
+        """
+        raise NotImplementedError()
+
+    def created(self):
+        """ Returns whether the state was already created """
+        raise NotImplementedError()
+
+    def create(self, **fields):
+        """ Create the state with the given global fields """
+        raise NotImplementedError()
+
+    def get(self, key, default=None):
+        """ Returns a global field of the state """
+        raise NotImplementedError()
+
+    def set(self, key, value):
+        """ Set a global field of the state """
+        raise NotImplementedError()
+
+    def experiments(self, statuses=None, reports=True):
+        """ Returns all experiments ordered by their id, or only the ones with one of the given statuses
+
+        If `reports` is `False`, the reports of the experiments might be omitted (where reading them is costly).
+        """
+        raise NotImplementedError()
+
+    def reports(self, cursor=None):
+        """ Returns the reports that were added since a cursor as (id, report) tuples, and the cursor after them
+
+        arguments:
+          - cursor (optional): A cursor that was returned by a previous call; all reports are returned if `None`.
+        """
+        cursor = dict(cursor or {}) # the number of reports of every experiment, by its id
+        reports = []
+
+        for experiment in self.experiments():
+            added = experiment.get('reports', [])[cursor.get(experiment['id'], 0):]
+            reports.extend((experiment['id'], report) for report in added)
+            cursor[experiment['id']] = cursor.get(experiment['id'], 0) + len(added)
+
+        return reports, cursor
+
+    def first(self, statuses):
+        """ Returns the experiment with the lowest id that has one of the given statuses, or `None` if there is none """
+        return next(iter(self.experiments(statuses)), None)
+
+    def experiment(self, id):
+        """ Returns an experiment by its id, or `None` if there is no such experiment """
+        raise NotImplementedError()
+
+    def next_id(self):
+        """ Returns the id for a new experiment """
+        experiments = self.experiments()
+        return 1 if len(experiments) == 0 else (max(experiment['id'] for experiment in experiments) + 1)
+
+    def add(self, experiment):
+        """ Add a new experiment """
+        raise NotImplementedError()
+
+    def update(self, id, **fields):
+        """ Update fields of an experiment """
+        raise NotImplementedError()
+
+    def report(self, id, report):
+        """ Append a report to an experiment """
+        raise NotImplementedError()
+
+class YAML(Backend):
+    """ Keeps the state in a single YAML file (runai.yaml) that is rewritten upon every change
+
+    Changes are applied as records (see `_apply`), so that backends could persist the records themselves.
+    The parsed state is cached along with the modification time and size of the file, so it is parsed again
+    only if the file was changed by another process.
+    """
+
+    def __init__(self, root):
+        super(YAML, self).__init__(root)
+        self.path = os.path.join(root, 'runai.yaml')
+        self._data = None
+        self._index = None
+        self._dirty = False
+        self._stat = None # the stat of the file when it was last read or written, if the cached state matches it
+
+    def load(self):
+        stat = self._fstat()
+
+        if stat is None:
+            self._data = None
+            self._index = None
+        elif stat != self._stat:
+            with open(self.path, 'r') as f:
+                self._data = yaml.load(f, Loader=Loader)
+            self._index = None
+
+        self._stat = stat
+        self._dirty = False
+
+    def commit(self):
+        if self._dirty:
+            self._dump()
+            self._dirty = False
+
+    def discard(self):
+        self._data = None
+        self._index = None
+        self._dirty = False
+        self._stat = None
+
+    def _fstat(self):
+        """ Returns the identity of the current version of the file, or `None` if there is no file """
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def _dump(self):
+        replace(self.path, yaml.dump(self._data, Dumper=Dumper, encoding='utf-8'))
+        self._stat = self._fstat()
+
+    def _record(self, record):
+        assert not self.readonly, 'HPO state could not be changed in a shared block'
+        self._apply(record)
+        self._dirty = True
+
+    def _apply(self, record):
+        self._stat = None # the cached state no longer matches the file
+        op = record['op']
+
+        if op == 'create':
+            self._data = dict(record['fields'])
+            self._index = None
+        elif op == 'set':
+            self._data[record['key']] = record['value']
+        elif op == 'add':
+            experiment = dict(record['experiment'])
+            self._data.setdefault('experiments', []).append(experiment)
+            self._indexed()[experiment['id']] = experiment
+        elif op == 'update':
+            self._indexed()[record['id']].update(record['fields'])
+        elif op == 'report':
+            self._indexed()[record['id']].setdefault('reports', []).append(record['report'])
+        else:
+            raise ValueError('Unrecognized HPO record %s' % op)
+
+    def _indexed(self):
+        if self._index is None:
+            self._index = { experiment['id']: experiment for experiment in self._data.get('experiments', []) }
+
+        return self._index
+
+    def snapshot(self):
+        try:
+            with open(self.path, 'r') as f:
+                return yaml.load(f, Loader=Loader)
+        except IOError:
+            return None
+
+    def created(self):
+        return self._data is not None
+
+    def create(self, **fields):
+        self._record(dict(op='create', fields=fields))
+
+    def get(self, key, default=None):
+        return self._data.get(key, default)
+
+    def set(self, key, value):
+        self._record(dict(op='set', key=key, value=value))
+
+    def experiments(self, statuses=None, reports=True):
+        experiments = self._data.get('experiments', [])
+
+        if statuses is not None:
+            experiments = [experiment for experiment in experiments if experiment['status'] in statuses]
+
+        return experiments
+
+    def first(self, statuses):
+        for experiment in self._data.get('experiments', []):
+            if experiment['status'] in statuses:
+                return experiment
+
+        return None
+
+    def experiment(self, id):
+        return self._indexed().get(id)
+
+    def add(self, experiment):
+        self._record(dict(op='add', experiment=experiment))
+
+    def update(self, id, **fields):
+        self._record(dict(op='update', id=id, fields=fields))
+
+    def report(self, id, report):
+        self._record(dict(op='report', id=id, report=report))
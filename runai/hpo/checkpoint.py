@@ -0,0 +1,91 @@
+import os
+import shutil
+import threading
+
+import runai.utils
+
+from .backend import replace
+
+class Checkpointer(object):
+    """ Writes checkpoints of an experiment to its checkpoint directory in a background thread
+
+    Every checkpoint is written to a directory of its own, and only then the name of the directory is written (atomically)
+    to the `latest` file, so a worker that is killed while writing never leaves a partial checkpoint as the latest one.
+    Only the latest checkpoint is kept.
+    A checkpoint that is requested while another one is being written replaces any checkpoint that is still waiting to be written.
+
+    arguments:
+      - path: The checkpoint directory of the experiment.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._pending = None # the `write` callable of the checkpoint that is waiting to be written
+        self._busy = False
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def latest(self):
+        """ Returns the directory of the latest checkpoint that was completely written, or `None` if there is none """
+        try:
+            with open(os.path.join(self.path, 'latest'), 'r') as f:
+                name = f.read().strip()
+        except IOError:
+            return None
+
+        return os.path.join(self.path, name)
+
+    def submit(self, write):
+        """ Write a checkpoint in the background
+
+        arguments:
+          - write: A callable that writes the checkpoint into the directory that is passed to it.
+        """
+        with self._condition:
+            self._pending = write
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run)
+                self._thread.daemon = True
+                self._thread.start()
+
+            self._condition.notify_all()
+
+    def wait(self, timeout=None):
+        """ Wait until the requested checkpoints were written; returns `False` upon timeout """
+        with self._condition:
+            return self._condition.wait_for(lambda: self._pending is None and not self._busy, timeout)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending is not None)
+                write, self._pending = self._pending, None
+                self._busy = True
+
+            try:
+                self._write(write)
+            except Exception as e:
+                runai.utils.log.error('Failed writing checkpoint to %s (%s)', self.path, e)
+            finally:
+                with self._condition:
+                    self._busy = False
+                    self._condition.notify_all()
+
+    def _write(self, write):
+        latest = self.latest()
+        index = 1 if latest is None else int(os.path.basename(latest).split('-')[-1]) + 1
+        name = 'checkpoint-%d' % index
+
+        directory = os.path.join(self.path, name)
+        shutil.rmtree(directory, ignore_errors=True) # of a worker that was killed while writing
+        os.makedirs(directory)
+
+        write(directory)
+        replace(os.path.join(self.path, 'latest'), name.encode('utf-8'))
+        runai.utils.log.debug('Wrote checkpoint %s', directory)
+
+        # remove previous checkpoints
+        for entry in os.listdir(self.path):
+            if entry.startswith('checkpoint-') and entry != name:
+                shutil.rmtree(os.path.join(self.path, entry), ignore_errors=True)
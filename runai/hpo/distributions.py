@@ -0,0 +1,136 @@
+import math
+import random
+
+class Distribution(object):
+    """ A distribution of the values of a hyperparameter, that could be passed in a grid instead of a list of values
+
+    Distributions are stored in the state by their (compact) encoding rather than by their values.
+    """
+
+    def sample(self, rng=random):
+        """ Returns a random value, drawn from `rng` (a `random.Random`; the global one by default) """
+        raise NotImplementedError()
+
+    def encode(self):
+        """ Returns the representation of the distribution that is stored in the state """
+        raise NotImplementedError()
+
+    def __eq__(self, other):
+        return type(self) == type(other) and self.encode() == other.encode()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        encoded = self.encode()
+        return '%s(%s)' % (type(self).__name__, ', '.join('%s=%r' % (key, encoded[key]) for key in sorted(encoded) if key != 'distribution'))
+
+class Uniform(Distribution):
+    """ Real values distributed uniformly between `low` and `high` """
+
+    def __init__(self, low, high):
+        if not low < high:
+            raise ValueError('Invalid range [%s, %s]' % (low, high))
+
+        self.low = low
+        self.high = high
+
+    def sample(self, rng=random):
+        return rng.uniform(self.low, self.high)
+
+    def encode(self):
+        return dict(distribution='uniform', low=self.low, high=self.high)
+
+class LogUniform(Distribution):
+    """ Positive real values whose logarithm is distributed uniformly between `log(low)` and `log(high)` (e.g. learning rates) """
+
+    def __init__(self, low, high):
+        if not 0 < low < high:
+            raise ValueError('Invalid range [%s, %s]' % (low, high))
+
+        self.low = low
+        self.high = high
+
+    def sample(self, rng=random):
+        # rounding errors could take the value out of the range
+        return min(max(math.exp(rng.uniform(math.log(self.low), math.log(self.high))), self.low), self.high)
+
+    def encode(self):
+        return dict(distribution='loguniform', low=self.low, high=self.high)
+
+class IntRange(Distribution):
+    """ Integers from `low` to `high` (inclusive) in steps of `step`, distributed uniformly
+
+    Could also be used in grid search, as its values could be enumerated.
+    """
+
+    def __init__(self, low, high, step=1):
+        if not (low <= high and step > 0):
+            raise ValueError('Invalid range [%s, %s] with step %s' % (low, high, step))
+
+        self.low = low
+        self.high = high
+        self.step = step
+
+    def __len__(self):
+        return (self.high - self.low) // self.step + 1
+
+    def __getitem__(self, index):
+        if not 0 <= index < len(self):
+            raise IndexError('Index %d out of range' % index)
+
+        return self.low + index * self.step
+
+    def sample(self, rng=random):
+        return self[rng.randrange(len(self))]
+
+    def encode(self):
+        return dict(distribution='intrange', low=self.low, high=self.high, step=self.step)
+
+class Categorical(Distribution):
+    """ A list of values, with optional relative weights (distributed uniformly if not passed)
+
+    Could also be used in grid search, where the weights are ignored.
+    """
+
+    def __init__(self, values, weights=None):
+        if len(values) == 0 or (weights is not None and (len(weights) != len(values) or min(weights) < 0 or sum(weights) <= 0)):
+            raise ValueError('Invalid values %s with weights %s' % (values, weights))
+
+        self.values = list(values)
+        self.weights = None if weights is None else list(weights)
+
+    def __len__(self):
+        return len(self.values)
+
+    def __getitem__(self, index):
+        return self.values[index]
+
+    def sample(self, rng=random):
+        return rng.choices(self.values, weights=self.weights)[0]
+
+    def encode(self):
+        return dict(distribution='categorical', values=self.values, weights=self.weights)
+
+DISTRIBUTIONS = dict(
+    uniform=Uniform,
+    loguniform=LogUniform,
+    intrange=IntRange,
+    categorical=Categorical,
+)
+
+def encode(values):
+    """ Returns the representation of the values of a hyperparameter (a list or a distribution) that is stored in the state """
+    return values.encode() if isinstance(values, Distribution) else list(values)
+
+def decode(values):
+    """ Returns the values of a hyperparameter (a list or a distribution) from their representation in the state """
+    if isinstance(values, dict):
+        fields = dict(values)
+        return DISTRIBUTIONS[fields.pop('distribution')](**fields)
+
+    return values
+
+def sample(values, rng=random):
+    """ Returns a random value of a hyperparameter (a list or a distribution), drawn from `rng` """
+    return values.sample(rng) if isinstance(values, Distribution) else rng.choice(values)
@@ -0,0 +1,22 @@
+import math
+
+def milestone(epoch, eta, min_epochs):
+    """ Returns whether an epoch is a rung of successive halving (i.e. `min_epochs * eta^k` for some k) """
+    rung = min_epochs
+
+    while rung < epoch:
+        rung *= eta
+
+    return rung == epoch
+
+def promoted(value, values, mode, eta):
+    """ Returns whether a value is in the top `1/eta` of the values recorded at a rung
+
+    arguments:
+      - value: The value of the experiment.
+      - values: The values of the other experiments that reached the rung.
+      - mode: 'max' if higher values are better, 'min' otherwise.
+      - eta: The reduction factor.
+    """
+    ranked = sorted(list(values) + [value], reverse=(mode == 'max'))
+    return ranked.index(value) < int(math.ceil(len(ranked) / float(eta)))
@@ -0,0 +1,146 @@
+import os
+
+from .backend import YAML, dumps, loads, replace
+
+COMPACTION = 1000 # the number of journal records after which the journal is compacted into the snapshot
+
+class Journal(YAML):
+    """ Appends changes as records to a journal file (runai.journal) instead of rewriting the whole state
+
+    The state is a YAML snapshot (runai.yaml) followed by the records of the journal.
+    Every process caches the state and reads only the records that were appended since it last read the journal,
+    so the cost of a change does not depend on the size of the experiment.
+    Once the journal is long enough, it is compacted into the snapshot.
+
+    The snapshot and the journal hold a generation number that is increased upon every compaction,
+    so processes could tell when their cached state is stale.
+    """
+
+    def __init__(self, root):
+        super(Journal, self).__init__(root)
+        self.journal = os.path.join(root, 'runai.journal')
+        self._generation = None # the generation of the cached state; `None` if the journal should be rewritten
+        self._offset = 0 # the journal offset up to which the cached state is updated
+        self._records = 0 # the number of records in the journal
+        self._pending = []
+
+    def load(self):
+        generation, header = self._header()
+
+        if generation is None or generation != self._generation or self._data is None:
+            super(Journal, self).load()
+
+            # a missing journal, or one of a generation other than the snapshot's (e.g. a compaction was interrupted),
+            # has nothing that is not already in the snapshot and will be rewritten upon the next commit
+            if generation is None or generation != (self._data or {}).get('journalGeneration', 0):
+                self._generation = None
+            else:
+                self._generation = generation
+                self._offset = header
+                self._records = 0
+
+        if self._generation is not None:
+            with open(self.journal, 'rb') as f:
+                f.seek(self._offset)
+                data = f.read()
+
+            # ignore a torn record of a process that was killed while appending (it will be truncated upon commit)
+            data = data[:data.rfind(b'\n') + 1]
+
+            for line in data.splitlines():
+                self._apply(loads(line.decode('utf-8')))
+                self._records += 1
+
+            self._offset += len(data)
+
+        self._pending = []
+        self._dirty = False
+
+    def commit(self):
+        if self._generation is None:
+            if self._dirty:
+                self.compact()
+        elif len(self._pending) > 0:
+            data = b''.join(self._line(record) for record in self._pending)
+
+            with open(self.journal, 'r+b') as f:
+                f.seek(self._offset)
+                f.truncate()
+                f.write(data)
+
+            self._offset += len(data)
+            self._records += len(self._pending)
+
+            if self._records >= COMPACTION:
+                self.compact()
+
+        self._pending = []
+        self._dirty = False
+
+    def discard(self):
+        super(Journal, self).discard()
+        self._generation = None
+        self._pending = []
+
+    def snapshot(self):
+        data = super(Journal, self).snapshot()
+
+        if data is None:
+            return None
+
+        try:
+            with open(self.journal, 'rb') as f:
+                lines = f.read().splitlines(True)
+        except IOError:
+            return data
+
+        # the records apply only if the journal is of the generation of the snapshot; otherwise, either a
+        # compaction is in progress (and the snapshot holds them) or the journal is stale
+        if len(lines) == 0 or not lines[0].endswith(b'\n') or loads(lines[0].decode('utf-8'))['generation'] != data.get('journalGeneration', 0):
+            return data
+
+        state = YAML(self.root) # applies the records to the snapshot rather than to the cached state
+        state._data = data
+
+        for line in lines[1:]:
+            if line.endswith(b'\n'): # ignore a torn record
+                state._apply(loads(line.decode('utf-8')))
+
+        return data
+
+    def compact(self):
+        """ Write the whole state as the snapshot and start a new (empty) journal (called under the lock) """
+        generation = self.get('journalGeneration', 0) + 1
+
+        # the snapshot must be written first, as the records of the current journal would be lost otherwise
+        self._data['journalGeneration'] = generation
+        self._dump()
+
+        header = self._line(dict(generation=generation))
+        replace(self.journal, header)
+
+        self._generation = generation
+        self._offset = len(header)
+        self._records = 0
+
+    def _header(self):
+        """ Returns the generation of the journal and the length of its header, or `None` if there is no journal """
+        try:
+            with open(self.journal, 'rb') as f:
+                line = f.readline()
+        except IOError:
+            return None, 0
+
+        if not line.endswith(b'\n'):
+            return None, 0
+
+        return loads(line.decode('utf-8'))['generation'], len(line)
+
+    def _line(self, record):
+        return (dumps(record, sort_keys=True) + '\n').encode('utf-8')
+
+    def _record(self, record):
+        assert not self.readonly, 'HPO state could not be changed in a shared block'
+        self._apply(record)
+        self._pending.append(record)
+        self._dirty = True
@@ -0,0 +1,120 @@
+import os
+import threading
+import time
+
+import runai.utils
+
+def take(path, token):
+    """ Take a lease by writing the token of the worker into its file (called under the lock of the experiment) """
+    with open(path, 'w') as f:
+        f.write(token)
+
+def owner(path):
+    """ Returns the token of the worker that holds a lease, or `None` if it was removed """
+    try:
+        with open(path, 'r') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+def touch(path, token):
+    """ Renew a lease by setting the modification time of its file to now
+
+    Returns `False` if the lease is no longer held by the worker (i.e. it expired and the experiment was reclaimed by
+    another worker, which may have taken it since), as renewing or recreating the file would claim the experiment again.
+    """
+    if owner(path) != token:
+        return False
+
+    try:
+        os.utime(path, None)
+    except FileNotFoundError:
+        return False
+
+    return True
+
+def expired(directory, lease):
+    """ Returns the ids of the experiments whose lease files in a directory were not renewed for `lease` seconds """
+    ids = []
+    deadline = time.time() - lease
+
+    try:
+        entries = os.listdir(directory)
+    except OSError:
+        return ids
+
+    for entry in entries:
+        try:
+            if os.path.getmtime(os.path.join(directory, entry)) < deadline:
+                ids.append(int(entry))
+        except (OSError, ValueError):
+            pass # removed meanwhile or not a lease file
+
+    return ids
+
+def remove(path, token):
+    """ Remove a lease file if it still holds the token (rather than a lease that another worker has taken since) """
+    if owner(path) != token:
+        return
+
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+class Heartbeat(object):
+    """ Renews the leases of experiments by touching their lease files periodically in a background thread
+
+    Touching a file is much cheaper than writing the state, and does not take the lock of the experiment.
+
+    arguments:
+      - paths: The lease files of the experiments.
+      - interval: Seconds between renewals (should be a fraction of the lease).
+      - token: The token of the worker, which its lease files hold.
+    """
+
+    def __init__(self, paths, interval, token):
+        self.paths = list(paths)
+        self.interval = interval
+        self.token = token
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+
+    def start(self):
+        self._touch()
+        self._thread.start()
+
+    def release(self, path):
+        """ Stop renewing a single lease and release it (remove its file) """
+        with self._lock:
+            if path in self.paths:
+                self.paths.remove(path)
+
+        remove(path, self.token)
+
+    def stop(self, release=True):
+        """ Stop renewing the leases, and release them (remove their files) unless `release` is `False` """
+        self._stop.set()
+
+        if self._thread.is_alive():
+            self._thread.join()
+
+        if release:
+            for path in self.paths:
+                remove(path, self.token)
+
+    def _touch(self):
+        with self._lock:
+            for path in list(self.paths):
+                try:
+                    if not touch(path, self.token):
+                        runai.utils.log.warning('Lease %s expired and was reclaimed by another worker; no longer renewing it', path)
+                        self.paths.remove(path)
+                except (IOError, OSError) as e:
+                    runai.utils.log.warning('Failed renewing lease %s (%s)', path, e)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._touch()
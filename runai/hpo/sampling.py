@@ -0,0 +1,111 @@
+import itertools
+import random
+
+from . import distributions
+
+ATTEMPTS = 32 # the number of consecutive duplicate draws after which the remaining configurations of a finite grid are enumerated
+DENSITY = 0.5 # the fraction of a finite grid that was sampled from which the remaining configurations are enumerated
+
+def _normalized(value):
+    # tuples and lists are the same, as backends might not keep tuples (e.g. of a state of a previous version)
+    if isinstance(value, (list, tuple)):
+        return [_normalized(item) for item in value]
+
+    if isinstance(value, dict):
+        return sorted(((key, _normalized(item)) for key, item in value.items()), key=lambda item: repr(item[0]))
+
+    return value
+
+def key(config):
+    """ Returns a hashable representation of a configuration """
+    return repr(_normalized(config))
+
+class Sampler(object):
+    """ Samples configurations of a grid reproducibly by a seed, and never samples a configuration twice
+
+    Draw number `i` is made by a generator that is seeded by `seed` and `i`, so the same draws are made no matter
+    which worker makes every one of them. Configurations that were sampled are kept in a hash index, so checking whether
+    a draw is a duplicate takes O(1), and only experiments that were added since the last pick are indexed upon every pick.
+    If the grid is finite (i.e. consists of lists, IntRange and Categorical) and most of it was sampled already, a configuration
+    is drawn from the remaining (enumerated) configurations instead, as most draws would be duplicates.
+
+    arguments:
+      - root: The directory of the experiment.
+      - grid: A dictionary of the possible values of every hyperparameter (a list or a distribution).
+      - seed: The seed of the experiment.
+    """
+
+    def __init__(self, root, grid, seed):
+        self.root = root
+        self.grid = { parameter: self._values(values) for parameter, values in grid.items() }
+        self.seed = seed
+        self.sampled = set() # keys of the sampled configurations
+        self._next = 1 # the id of the next experiment to index
+        self._remaining = None # configurations that were not sampled, in the order of the grid; enumerated once needed
+
+        if all(hasattr(values, '__len__') for values in self.grid.values()):
+            self.size = 1
+            for values in self.grid.values():
+                self.size *= len(values)
+        else:
+            self.size = None # infinite
+
+    @staticmethod
+    def _values(values):
+        return values if isinstance(values, distributions.Distribution) else list(values)
+
+    def matches(self, root, grid, seed):
+        """ Returns whether the sampler is of these arguments """
+        return (self.root, self.grid, self.seed) == (root, { parameter: self._values(values) for parameter, values in grid.items() }, seed)
+
+    def observe(self, backend):
+        """ Index the configurations of the experiments that were added since the last call (called under the lock) """
+        next_id = backend.next_id()
+
+        for id in range(self._next, next_id):
+            experiment = backend.experiment(id)
+
+            if experiment is not None:
+                self.sampled.add(key(experiment['config']))
+
+        self._next = max(self._next, next_id)
+
+    def sample(self, cursor):
+        """ Returns a configuration that was not sampled yet (or `None` if all of the grid was sampled) and the cursor after it
+
+        arguments:
+          - cursor: The number of draws that were made until now (by all workers).
+        """
+        if self.size is not None and len(self.sampled) >= self.size:
+            return None, cursor
+
+        attempts = 0
+
+        while self.size is None or (len(self.sampled) < DENSITY * self.size and attempts < ATTEMPTS):
+            rng = self._rng(cursor)
+            cursor += 1
+
+            config = { parameter: distributions.sample(values, rng) for parameter, values in self.grid.items() }
+
+            if key(config) not in self.sampled:
+                return config, cursor
+
+            attempts += 1
+
+        if self._remaining is None:
+            parameters = list(self.grid)
+            choices = [[values[index] for index in range(len(values))] for values in self.grid.values()]
+            self._remaining = [dict(zip(parameters, combination)) for combination in itertools.product(*choices)]
+
+        if len(self._remaining) + len(self.sampled) != self.size: # configurations were sampled since
+            self._remaining = [config for config in self._remaining if key(config) not in self.sampled]
+
+        if len(self._remaining) == 0: # configurations that are not of the grid were sampled (e.g. of a previous grid)
+            return None, cursor
+
+        rng = self._rng(cursor)
+        return self._remaining[rng.randrange(len(self._remaining))], cursor + 1
+
+    def _rng(self, cursor):
+        # seeding by a string is stable between processes and Python versions (unlike by a hash of a tuple)
+        return random.Random('%s:%d' % (self.seed, cursor))
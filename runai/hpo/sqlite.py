@@ -0,0 +1,178 @@
+import os
+import sqlite3
+
+import runai.utils
+
+from .backend import Backend, YAML, dumps, loads
+
+SCHEMA = [
+    'CREATE TABLE IF NOT EXISTS state (key TEXT PRIMARY KEY, value TEXT)',
+    'CREATE TABLE IF NOT EXISTS experiments (id INTEGER PRIMARY KEY, status TEXT, data TEXT)',
+    'CREATE INDEX IF NOT EXISTS experiments_status ON experiments (status, id)',
+    'CREATE TABLE IF NOT EXISTS reports (experiment INTEGER, data TEXT)',
+    'CREATE INDEX IF NOT EXISTS reports_experiment ON reports (experiment)',
+]
+
+class SQLite(Backend):
+    """ Keeps the state in an SQLite database (runai.sqlite) with experiments indexed by their id and status
+
+    Every `with` block is a single (immediate) transaction, so picking the next experiment takes O(log n)
+    regardless of the size of the experiment.
+    An existing runai.yaml (e.g. of an experiment started with another backend) is migrated into the database
+    upon first use, and is not updated afterwards.
+    """
+
+    def __init__(self, root):
+        super(SQLite, self).__init__(root)
+        self.path = os.path.join(root, 'runai.sqlite')
+        self._connection = None
+
+    def load(self):
+        if self._connection is None:
+            # transactions are managed explicitly
+            self._connection = sqlite3.connect(self.path, isolation_level=None)
+
+        if self.readonly:
+            # shared blocks may run concurrently, so they only read (and creating the schema or migrating are writes)
+            self._connection.execute('PRAGMA query_only = ON')
+            self._connection.execute('BEGIN')
+            return
+
+        self._connection.execute('PRAGMA query_only = OFF')
+        self._connection.execute('BEGIN IMMEDIATE')
+
+        for statement in SCHEMA:
+            self._connection.execute(statement)
+
+        if not self.created():
+            self._migrate()
+
+    def commit(self):
+        self._connection.execute('COMMIT')
+
+    def discard(self):
+        self._connection.execute('ROLLBACK')
+
+    def _migrate(self):
+        path = os.path.join(self.root, 'runai.yaml')
+        data = YAML(self.root).snapshot()
+
+        if data is None:
+            return
+
+        runai.utils.log.info('Migrating HPO state from %s to %s', path, self.path)
+
+        experiments = data.pop('experiments', [])
+        self.create(**data)
+
+        for experiment in experiments:
+            reports = experiment.pop('reports', [])
+            self.add(experiment)
+
+            for report in reports:
+                self.report(experiment['id'], report)
+
+    def _experiment(self, row):
+        id, data = row
+        experiment = loads(data)
+        experiment['reports'] = [loads(report) for report, in self._connection.execute('SELECT data FROM reports WHERE experiment = ? ORDER BY rowid', (id,))]
+        return experiment
+
+    def snapshot(self):
+        if not os.path.isfile(self.path): # the state was not migrated yet
+            return YAML(self.root).snapshot()
+
+        # a separate connection that reads in a single (deferred) transaction, so it does not block writers
+        connection = sqlite3.connect(self.path, isolation_level=None)
+
+        try:
+            connection.execute('BEGIN')
+
+            if connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'state'").fetchone() is None:
+                return YAML(self.root).snapshot()
+
+            data = { key: loads(value) for key, value in connection.execute('SELECT key, value FROM state') }
+            if len(data) == 0:
+                return None
+
+            data['experiments'] = self._experiments(connection)
+            return data
+        finally:
+            connection.close()
+
+    def created(self):
+        if self.readonly and self._connection.execute("SELECT 1 FROM sqlite_master WHERE name = 'state'").fetchone() is None:
+            return False # the schema was not created yet
+
+        return self._connection.execute('SELECT 1 FROM state LIMIT 1').fetchone() is not None
+
+    def create(self, **fields):
+        for key, value in fields.items():
+            self.set(key, value)
+
+    def get(self, key, default=None):
+        row = self._connection.execute('SELECT value FROM state WHERE key = ?', (key,)).fetchone()
+        return default if row is None else loads(row[0])
+
+    def set(self, key, value):
+        self._connection.execute('INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)', (key, dumps(value)))
+
+    def experiments(self, statuses=None, reports=True):
+        return self._experiments(self._connection, statuses, reports)
+
+    def _experiments(self, connection, statuses=None, reports=True):
+        if statuses is None:
+            rows = connection.execute('SELECT id, data FROM experiments ORDER BY id').fetchall()
+            cursor = connection.execute('SELECT experiment, data FROM reports ORDER BY rowid') if reports else []
+        else:
+            placeholders = ', '.join('?' * len(statuses))
+            rows = connection.execute('SELECT id, data FROM experiments WHERE status IN (%s) ORDER BY id' % placeholders, tuple(statuses)).fetchall()
+
+            # only the reports of the selected experiments (using the index of the reports by their experiment)
+            cursor = connection.execute('SELECT experiment, data FROM reports WHERE experiment IN (SELECT id FROM experiments WHERE status IN (%s)) ORDER BY rowid' % placeholders, tuple(statuses)) if reports else []
+
+        grouped = {} # reports by the id of their experiment
+        for id, data in cursor:
+            grouped.setdefault(id, []).append(loads(data))
+
+        experiments = []
+        for id, data in rows:
+            experiment = loads(data)
+            if reports:
+                experiment['reports'] = grouped.get(id, [])
+            experiments.append(experiment)
+
+        return experiments
+
+    def reports(self, cursor=None):
+        # the cursor is the rowid of the last returned report
+        rows = self._connection.execute('SELECT rowid, experiment, data FROM reports WHERE rowid > ? ORDER BY rowid', (cursor or 0,)).fetchall()
+        return [(id, loads(data)) for _, id, data in rows], (rows[-1][0] if len(rows) > 0 else cursor)
+
+    def first(self, statuses):
+        # a lookup per status makes use of the index (rather than sorting all matching experiments)
+        rows = [self._connection.execute('SELECT id, data FROM experiments WHERE status = ? ORDER BY id LIMIT 1', (status,)).fetchone() for status in statuses]
+        rows = [row for row in rows if row is not None]
+
+        return self._experiment(min(rows)) if len(rows) > 0 else None
+
+    def experiment(self, id):
+        row = self._connection.execute('SELECT id, data FROM experiments WHERE id = ?', (id,)).fetchone()
+        return None if row is None else self._experiment(row)
+
+    def next_id(self):
+        id, = self._connection.execute('SELECT MAX(id) FROM experiments').fetchone()
+        return 1 if id is None else id + 1
+
+    def add(self, experiment):
+        experiment = { key: value for key, value in experiment.items() if key != 'reports' }
+        self._connection.execute('INSERT INTO experiments (id, status, data) VALUES (?, ?, ?)', (experiment['id'], experiment.get('status'), dumps(experiment)))
+
+    def update(self, id, **fields):
+        data, = self._connection.execute('SELECT data FROM experiments WHERE id = ?', (id,)).fetchone()
+        experiment = loads(data)
+        experiment.update(fields)
+        self._connection.execute('UPDATE experiments SET status = ?, data = ? WHERE id = ?', (experiment.get('status'), dumps(experiment), id))
+
+    def report(self, id, report):
+        self._connection.execute('INSERT INTO reports (experiment, data) VALUES (?, ?)', (id, dumps(report)))
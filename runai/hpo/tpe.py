@@ -0,0 +1,175 @@
+import math
+import random
+
+from . import distributions
+
+GAMMA = 0.25 # the fraction of the experiments that are considered good
+CANDIDATES = 24 # the number of configurations sampled from the good density, of which the best one is proposed
+STARTUP = 10 # the number of experiments with reports before proposals are made by the model (rather than randomized)
+BANDWIDTH = 0.2 # the bandwidth of the kernels of a single observation, relative to the range of the distribution
+PRIOR = 1. # the weight of the prior (i.e. the distribution of the hyperparameter) in every density
+
+class Histogram(object):
+    """ A density over the values of a list or a Categorical, smoothed by their prior weights """
+
+    def __init__(self, values, observations):
+        self.values = values.values if isinstance(values, distributions.Categorical) else list(values)
+        prior = values.weights if isinstance(values, distributions.Categorical) and values.weights is not None else [1.] * len(self.values)
+        weights = [PRIOR * weight / sum(prior) for weight in prior]
+
+        for value in observations:
+            if value in self.values:
+                weights[self.values.index(value)] += 1
+
+        total = sum(weights)
+        self.probabilities = [weight / total for weight in weights]
+
+    def sample(self):
+        return random.choices(range(len(self.values)), weights=self.probabilities)[0]
+
+    def pdf(self, index):
+        return self.probabilities[index]
+
+    def value(self, index):
+        return self.values[index]
+
+class Parzen(object):
+    """ A Gaussian kernel density over the values of a Uniform, LogUniform or IntRange, mixed with the distribution itself
+
+    LogUniform values are modeled in log scale.
+    """
+
+    def __init__(self, distribution, observations):
+        self.distribution = distribution
+        self.log = isinstance(distribution, distributions.LogUniform)
+        self.low = self._transform(distribution.low)
+        self.high = self._transform(distribution.high)
+        self.points = [self._transform(value) for value in observations if distribution.low <= value <= distribution.high]
+
+        # narrower kernels as there are more observations (Scott's rule, of a fraction of the range)
+        self.bandwidth = max(BANDWIDTH * (self.high - self.low) * (len(self.points) + 1) ** -0.2, 1e-12)
+
+    def _transform(self, value):
+        return math.log(value) if self.log else float(value)
+
+    def sample(self):
+        if random.uniform(0, PRIOR + len(self.points)) < PRIOR:
+            return random.uniform(self.low, self.high)
+
+        return min(max(random.gauss(random.choice(self.points), self.bandwidth), self.low), self.high)
+
+    def pdf(self, point):
+        density = PRIOR / max(self.high - self.low, 1e-12)
+
+        for center in self.points:
+            density += math.exp(-0.5 * ((point - center) / self.bandwidth) ** 2) / (self.bandwidth * math.sqrt(2 * math.pi))
+
+        return density / (PRIOR + len(self.points))
+
+    def value(self, point):
+        if self.log: # rounding errors could take the value out of the range
+            return min(max(math.exp(point), self.distribution.low), self.distribution.high)
+
+        if isinstance(self.distribution, distributions.IntRange):
+            index = int(round((point - self.distribution.low) / self.distribution.step))
+            return self.distribution[min(max(index, 0), len(self.distribution) - 1)]
+
+        return point
+
+class TPE(object):
+    """ A Tree-structured Parzen Estimator over the values of a grid
+
+    Experiments are split by their best reported `metric` to good (the top `GAMMA`) and bad ones, and the values of every
+    hyperparameter are modeled by two densities - `l` of the good experiments and `g` of the bad ones; a histogram
+    for lists and Categorical, and a Parzen estimator for Uniform, LogUniform and IntRange.
+    Configurations are proposed by sampling candidates from `l` and picking the one that maximizes `l / g`.
+
+    The model is kept between picks. Only reports that were not observed yet are processed upon every pick,
+    and the densities are fitted again only if the score of any experiment has changed.
+
+    arguments:
+      - grid: A dictionary of the possible values of every hyperparameter (a list or a distribution).
+      - metric: The reported metric to optimize.
+      - mode: 'max' if higher values of `metric` are better, 'min' otherwise.
+      - root (optional): The directory of the experiment, as experiments of other directories have other ids.
+    """
+
+    def __init__(self, grid, metric, mode, root=None):
+        self.root = root
+        self.grid = { parameter: self._values(values) for parameter, values in grid.items() }
+        self.metric = metric
+        self.mode = mode
+        self.scores = {} # the best value of `metric` of every experiment, by its id
+        self._observed = {} # the number of observed reports of every experiment, by its id
+        self._configs = {} # the configuration of every experiment, by its id
+        self._densities = None # `l` and `g` of every hyperparameter; `None` if they should be fitted
+
+    @staticmethod
+    def _values(values):
+        return values if isinstance(values, distributions.Distribution) else list(values)
+
+    def matches(self, grid, metric, mode, root=None):
+        """ Returns whether the model is of these arguments """
+        return (self.root, self.grid, self.metric, self.mode) == (root, { parameter: self._values(values) for parameter, values in grid.items() }, metric, mode)
+
+    def observe(self, experiments):
+        """ Observe the reports of experiments """
+        better = max if self.mode == 'max' else min
+
+        for experiment in experiments:
+            id = experiment['id']
+            reports = experiment.get('reports', [])
+
+            for report in reports[self._observed.get(id, 0):]:
+                value = report.get('metrics', {}).get(self.metric)
+
+                if value is None:
+                    continue
+
+                score = value if id not in self.scores else better(self.scores[id], value)
+
+                if self.scores.get(id) != score:
+                    self.scores[id] = score
+                    self._densities = None
+
+            self._observed[id] = len(reports)
+            self._configs[id] = experiment['config']
+
+    def fit(self):
+        """ Fit the densities (if the scores have changed since they were last fitted) """
+        if self._densities is not None:
+            return self._densities
+
+        ids = sorted(self.scores, key=lambda id: self.scores[id], reverse=(self.mode == 'max'))
+        count = max(1, int(math.ceil(GAMMA * len(ids))))
+
+        self._densities = {
+            parameter: (self._density(parameter, ids[:count]), self._density(parameter, ids[count:]))
+            for parameter in self.grid
+        }
+
+        return self._densities
+
+    def _density(self, parameter, ids):
+        values = self.grid[parameter]
+        observations = [self._configs[id][parameter] for id in ids if parameter in self._configs[id]]
+
+        if isinstance(values, (distributions.Uniform, distributions.LogUniform, distributions.IntRange)):
+            return Parzen(values, observations)
+
+        return Histogram(values, observations)
+
+    def suggest(self):
+        """ Propose a configuration; randomized if there are not enough experiments with reports """
+        if len(self.scores) < STARTUP:
+            return { parameter: distributions.sample(values) for parameter, values in self.grid.items() }
+
+        config = {}
+
+        # the hyperparameters are modeled independently, so the best candidate is picked for each one of them
+        for parameter, (l, g) in self.fit().items():
+            candidates = [l.sample() for _ in range(CANDIDATES)]
+            best = max(candidates, key=lambda candidate: math.log(l.pdf(candidate)) - math.log(g.pdf(candidate)))
+            config[parameter] = l.value(best)
+
+        return config
@@ -1 +1,5 @@
-from .report_promethues import Reporter, reportMetric, reportParameter, finish
+from .report_promethues import Backend, Overflow, Reporter, reportMetric, reportParameter, report_many, finish
+from .policy import Policy
+from .aio import AsyncReporter
+from .sink import Sink
+from .spool import Spool, replay
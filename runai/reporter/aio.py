@@ -0,0 +1,111 @@
+import asyncio
+import concurrent.futures
+import time
+
+import runai.utils
+
+from . import report_promethues
+from .report_promethues import Counters, ReportType, default_sink, pack, unpack
+
+async def drain(queue, size, interval, timeout=None):
+    """ An asyncio version of `report_promethues.drain` """
+    msgs = []
+    deadline = None
+
+    while len(msgs) < size:
+        try:
+            if deadline is None:
+                msg = await asyncio.wait_for(queue.get(), timeout)
+                deadline = time.time() + interval
+            else:
+                msg = await asyncio.wait_for(queue.get(), max(0, deadline - time.time()))
+        except asyncio.TimeoutError:
+            break
+
+        if msg is None:
+            return msgs, True
+
+        msgs.append(msg)
+
+    return msgs, False
+
+class AsyncReporter(object):
+    """ A reporter for asyncio applications
+
+    Reports from all coroutines are batched together and are pushed by a task in the running event loop.
+    The pushes themselves run in a single background thread so they never block the event loop,
+    and so all of them use the same connection to the Pushgateway.
+
+    Could be used as an asynchronous context manager (i.e. using `async with`).
+    """
+
+    def __init__(self, maxsize=None, sink=None):
+        """ Create an asyncio reporter
+
+        arguments:
+          - maxsize (optional): The maximum number of queued messages (a single report, or all reports of a `report_many` call); 0 means unbounded. Defaults to `report_promethues.QUEUE_SIZE`.
+                                Reporting while the queue is full waits (asynchronously) until it has room.
+          - sink (optional): A `Sink` to push the reports to. Defaults to `report_promethues.default_sink()`.
+        """
+        self._maxsize = report_promethues.QUEUE_SIZE if maxsize is None else maxsize
+        self._queue = None
+        self._task = None
+        self._sink = sink
+        self.counters = Counters()
+
+    async def _impl(self):
+        sink = self._sink or default_sink()
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        loop = asyncio.get_event_loop()
+
+        while True:
+            msgs, done = await drain(self._queue, report_promethues.BATCH_SIZE, report_promethues.FLUSH_INTERVAL, timeout=sink.pending())
+
+            # we catch all errors as the task should
+            # be running until told to stop
+            try:
+                sink.count(self.counters)
+                self.counters.pushed += await loop.run_in_executor(executor, sink.push, unpack(msgs), done)
+            except Exception:
+                pass
+
+            if done:
+                break
+
+        await loop.run_in_executor(executor, sink.close)
+        executor.shutdown()
+
+    async def start(self):
+        self._queue = asyncio.Queue(self._maxsize)
+        self._task = asyncio.ensure_future(self._impl())
+
+        runai.utils.log.debug('Started reporting task')
+
+    async def finish(self):
+        await self._queue.put(None)
+        await self._task
+
+        runai.utils.log.debug('Reporting task finished')
+
+    async def __aenter__(self):
+        await self.start()
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.finish()
+
+    async def send(self, msg):
+        await self._queue.put(msg)
+
+    async def report_metric(self, name, value):
+        await self.send((name, value, ReportType.metric))
+
+    async def report_parameter(self, name, value):
+        await self.send((name, value, ReportType.parameter))
+
+    async def report_many(self, metrics=None, parameters=None):
+        """ Report multiple metrics and parameters given as dictionaries of names to values """
+        msg = pack(metrics, parameters)
+
+        if len(msg) > 0:
+            await self.send(msg)
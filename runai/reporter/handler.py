@@ -0,0 +1,63 @@
+import http.client
+import urllib.parse
+
+class KeepAliveHandler(object):
+    """ A Pushgateway handler that reuses persistent HTTP connections
+
+    Could be passed as `handler` to the `prometheus_client` push methods (e.g. `pushadd_to_gateway`).
+    The default handler opens a new connection (and possibly a TLS session) for every push.
+    """
+
+    def __init__(self):
+        self._connections = {}
+
+    def __call__(self, url, method, timeout, headers, data):
+        def handle():
+            self.request(url, method, timeout, headers, data)
+
+        return handle
+
+    def request(self, url, method, timeout, headers, data):
+        url = urllib.parse.urlsplit(url)
+        key = (url.scheme, url.netloc)
+        path = url.path + ('?' + url.query if url.query else '')
+
+        # a reused connection might have been closed by the server while
+        # idle, so in such case we retry once over a new connection
+        reused = key in self._connections
+
+        while True:
+            connection = self._connection(key, timeout)
+
+            try:
+                connection.request(method, path, body=data, headers=dict(headers))
+                response = connection.getresponse()
+                response.read() # the response must be fully read before reusing the connection
+                break
+            except (http.client.HTTPException, OSError) as e:
+                self._close(key)
+
+                if not reused:
+                    raise IOError(e)
+
+                reused = False
+
+        if response.status >= 400:
+            raise IOError("error talking to pushgateway: {0} {1}".format(response.status, response.reason))
+
+    def close(self):
+        for key in list(self._connections):
+            self._close(key)
+
+    def _connection(self, key, timeout):
+        if key not in self._connections:
+            scheme, netloc = key
+            cls = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+            self._connections[key] = cls(netloc, timeout=timeout)
+
+        return self._connections[key]
+
+    def _close(self, key):
+        connection = self._connections.pop(key, None)
+        if connection is not None:
+            connection.close()
@@ -23,7 +23,7 @@ def disableAutoLog():
     keras.Model.compile = __original_compile__
 
 def autolog(accuracy=True, loss=True, learning_rate=True, epoch=True, step=True, batch_size=True, overall_epochs=True,
-            optimizer_name=True, number_of_layers=True, loss_method=False, epsilon=False, reporter=None):
+            optimizer_name=True, number_of_layers=True, loss_method=False, epsilon=False, reporter=None, policy=None):
     # The following line must be at top of the method
     autolog_inputs = locals()
 
@@ -135,7 +135,15 @@ def autolog(accuracy=True, loss=True, learning_rate=True, epoch=True, step=True,
     def _should_report_metric_or_parameter(autolog_inputs, key):
         return key in autolog_inputs and autolog_inputs[key]
 
+    def _report_batch_metric_if_needed(autolog_inputs, key, value):
+        if policy is None or policy.changed(key, value):
+            _report_metric_if_needed(autolog_inputs, key, value)
+
     class KerasAutoMetricReporter(keras.callbacks.Callback):
+        def __init__(self):
+            super(KerasAutoMetricReporter, self).__init__()
+            self._skipped = None # the last batch that was not reported due to the policy
+
         def on_train_begin(self, logs=None):
             _report_parameter_if_needed(autolog_inputs, 'optimizer_name', type(self.model.optimizer).__name__)
             _report_metric_if_needed(autolog_inputs, 'number_of_layers', len(self.model.layers))
@@ -144,17 +152,32 @@ def autolog(accuracy=True, loss=True, learning_rate=True, epoch=True, step=True,
             self._report_parameter_from_model_optimizer('epsilon')
 
         def on_batch_end(self, batch, logs={}):
-            _report_metric_if_needed(autolog_inputs, 'step', batch)
-            self._report_metric_from_logs_if_needed(autolog_inputs, "acc", logs, metric_name="accuracy")
-            self._report_metric_from_logs_if_needed(autolog_inputs, "loss", logs)
+            # skip reporting batches according to the policy, so we would not
+            # pay for sending values that will be overwritten anyway
+            if policy is not None and not policy.sample():
+                self._skipped = (batch, logs)
+                return
+
+            self._skipped = None
+            self._report_batch(batch, logs)
 
         def on_epoch_begin(self, epoch_val, logs=None):
             _report_metric_if_needed(autolog_inputs, 'epoch', epoch_val)
 
         def on_epoch_end(self, epoch_val, logs=None):
+            # make sure the last batch of the epoch is reported even if it was skipped
+            if self._skipped is not None:
+                self._report_batch(*self._skipped)
+                self._skipped = None
+
             _report_metric_if_needed(autolog_inputs, 'epoch', epoch_val)
             self._report_parameter_from_model_optimizer('learning_rate', 'lr')
 
+        def _report_batch(self, batch, logs):
+            _report_batch_metric_if_needed(autolog_inputs, 'step', batch)
+            self._report_metric_from_logs_if_needed(autolog_inputs, "acc", logs, metric_name="accuracy")
+            self._report_metric_from_logs_if_needed(autolog_inputs, "loss", logs)
+
         def _report_parameter_from_model_optimizer(self, metric_name, name_of_optimizer_attr=None):
             if not name_of_optimizer_attr:
                 name_of_optimizer_attr = metric_name
@@ -173,7 +196,7 @@ def autolog(accuracy=True, loss=True, learning_rate=True, epoch=True, step=True,
             if not metric_name:
                 metric_name = key_in_logs
 
-            _report_metric_if_needed(autolog_inputs, metric_name, logs[key_in_logs])
+            _report_batch_metric_if_needed(autolog_inputs, metric_name, logs[key_in_logs])
 
 class Reporter(runai.reporter.Reporter):
     def __init__(self, *args, **kwargs):
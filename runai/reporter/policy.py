@@ -0,0 +1,53 @@
+import time
+
+class Policy(object):
+    """ A reporting policy for high-frequency reports (e.g. per-batch metrics)
+
+    Reports that are filtered out by the policy are never sent, so they cost nothing but the check itself.
+
+    arguments:
+      - every (optional): Report once every `every` calls.
+      - rate (optional): Report at most `rate` times per second.
+      - delta (optional): Report a value only if it changed by at least `delta` since it was last reported.
+    """
+
+    def __init__(self, every=None, rate=None, delta=None):
+        if every is not None and every < 1:
+            raise ValueError('Policy `every` (%s) must be at least 1' % every)
+
+        if rate is not None and rate <= 0:
+            raise ValueError('Policy `rate` (%s) must be positive' % rate)
+
+        self.every = every
+        self.rate = rate
+        self.delta = delta
+        self._calls = 0
+        self._last_time = None
+        self._last_values = {}
+
+    def sample(self):
+        """ Returns whether the current call should be reported according to `every` and `rate` """
+        self._calls += 1
+
+        if self.every is not None and (self._calls - 1) % self.every != 0:
+            return False
+
+        if self.rate is not None:
+            now = time.time()
+            if self._last_time is not None and now - self._last_time < 1. / self.rate:
+                return False
+            self._last_time = now
+
+        return True
+
+    def changed(self, name, value):
+        """ Returns whether `value` should be reported according to `delta`, and records it if so """
+        if self.delta is None:
+            return True
+
+        last = self._last_values.get(name)
+        if last is not None and abs(value - last) < self.delta:
+            return False
+
+        self._last_values[name] = value
+        return True
@@ -1,101 +1,367 @@
+import collections
 import enum
 import multiprocessing
 import os
+import queue
+import random
+import threading
+import time
+
+from queue import Empty, Full
 
 from prometheus_client import CollectorRegistry, Gauge, pushadd_to_gateway
 
 import runai.utils
 
+from .handler import KeepAliveHandler
+from .sink import Discard, Sink
+
 GROUPING_KEY = "podUUID"
 GATEWAY_URL_KEY = "reporterGatewayURL"
+BACKEND_KEY = "reporterBackend"
+SPOOL_PATH_KEY = "reporterSpoolPath"
 PUSH_GATEWAY_JOB_NAME = "reporter_pod_info"
 REPORTER_PUSH_GATEWAY_METRIC_PREFIX = "reporter_push_gateway_metric"
 REPORTER_PUSH_GATEWAY_METRIC_PARAMETER = "reporter_push_gateway_parameter"
+REPORTER_PUSH_GATEWAY_MESSAGES = "reporter_push_gateway_reporter_messages"
 REPORTER = None
-RETRIES = 3
+GATEWAY = None
+TIMEOUT = 10 # seconds
+BACKOFF = 1 # seconds; the delay after the first consecutive push failure
+MAX_BACKOFF = 60 # seconds
+BATCH_SIZE = 1000 # maximum number of messages pushed at once
+FLUSH_INTERVAL = 1 # seconds
+QUEUE_SIZE = 0 # unbounded
 
 class ReportType(enum.Enum):
     metric = 1
     parameter = 2
 
+class Overflow(enum.Enum):
+    """ What to do with a message that is sent when the (bounded) queue is full """
+    drop_oldest = 1 # drop the oldest message in the queue
+    drop_newest = 2 # drop the message being sent
+    coalesce = 3 # hold the reports of the message and send only the last value of each name once the queue has room
+
+OVERFLOW = Overflow.drop_oldest
+
+class Backend(enum.Enum):
+    """ Where the reports are pushed from """
+    process = 'process' # a separate worker process
+    thread = 'thread' # a daemon thread in this process; no process spawning but shares the GIL
+
+class Counters(object):
+    """ Message counters shared between the reporting process and the worker process """
+
+    def __init__(self):
+        # every counter is written by a single process so no locks are needed
+        self._dropped = multiprocessing.RawValue('L', 0)
+        self._coalesced = multiprocessing.RawValue('L', 0)
+        self._pushed = multiprocessing.RawValue('L', 0)
+
+    @property
+    def dropped(self):
+        return self._dropped.value
+
+    @dropped.setter
+    def dropped(self, value):
+        self._dropped.value = value
+
+    @property
+    def coalesced(self):
+        return self._coalesced.value
+
+    @coalesced.setter
+    def coalesced(self, value):
+        self._coalesced.value = value
+
+    @property
+    def pushed(self):
+        return self._pushed.value
+
+    @pushed.setter
+    def pushed(self, value):
+        self._pushed.value = value
+
 def reportMetric(name, value):
     send(name, value, ReportType.metric)
 
 def reportParameter(name, value):
     send(name, value, ReportType.parameter)
 
-def push(reporter_name, reporter_value, report_type):
-    if push.failures >= RETRIES:
-        return
+def report_many(metrics=None, parameters=None):
+    reporter().report_many(metrics, parameters)
 
-    registry = CollectorRegistry()
+def pack(metrics=None, parameters=None):
+    """ Pack dictionaries of metrics and parameters into a single message """
+    return [(name, value, ReportType.metric) for name, value in (metrics or {}).items()] + \
+           [(name, value, ReportType.parameter) for name, value in (parameters or {}).items()]
 
-    if report_type is ReportType.metric:
-        label_names = ['metric_name', 'push_gateway_type']
-        label_values = [reporter_name, 'metric']
-        gauge_name = REPORTER_PUSH_GATEWAY_METRIC_PREFIX + "_" + reporter_name
-        gauge_value = reporter_value
+def unpack(msgs):
+    """ Returns the reports of the messages; a message is either a single report or a list of reports """
+    return [report for msg in msgs for report in (msg if isinstance(msg, list) else [msg])]
 
-    else:
-        label_names = ['param_name', 'param_value', 'push_gateway_type']
-        label_values = [reporter_name, reporter_value, 'parameter']
-        gauge_name = REPORTER_PUSH_GATEWAY_METRIC_PARAMETER + "_" + reporter_name
-        gauge_value = 1
+def coalesce(reports):
+    # keep only the last value of every (name, type) pair as the push gateway
+    # would anyway hold only the last value of each gauge
+    latest = collections.OrderedDict()
+    for reporter_name, reporter_value, report_type in reports:
+        latest[(reporter_name, report_type)] = reporter_value
 
-    gauge = Gauge(name=gauge_name, documentation="",labelnames=label_names, registry=registry)
+    return [(reporter_name, reporter_value, report_type) for (reporter_name, report_type), reporter_value in latest.items()]
 
-    gauge.labels(*label_values).set(gauge_value)
+class Pushgateway(Sink):
+    """ Pushes reports to the Prometheus Pushgateway
 
-    try:
-        pushadd_to_gateway(gateway=os.environ[GATEWAY_URL_KEY], job=PUSH_GATEWAY_JOB_NAME,
-                        registry=registry, grouping_key={GROUPING_KEY: os.environ[GROUPING_KEY]})
+    Gauges are kept in a single long-lived registry and are created once per name.
+    The HTTP connection to the Pushgateway is kept alive between pushes.
+
+    After a failure, pushes are skipped for an exponentially growing (jittered) delay,
+    and afterwards the next push probes the Pushgateway again.
+    Meanwhile, the latest values are kept in the registry and are pushed upon recovery.
+    """
+
+    def __init__(self):
+        self.registry = CollectorRegistry()
+        self.handler = KeepAliveHandler()
+        self.failures = 0
+        self._gauges = {}
+        self._retry = 0 # pushes are skipped until this time
+        self._unpushed = 0 # the number of reports that were not pushed yet
+
+    def set(self, reporter_name, reporter_value, report_type):
+        if report_type is ReportType.metric:
+            label_names = ['metric_name', 'push_gateway_type']
+            label_values = [reporter_name, 'metric']
+            gauge_name = REPORTER_PUSH_GATEWAY_METRIC_PREFIX + "_" + reporter_name
+            gauge_value = reporter_value
+
+        else:
+            label_names = ['param_name', 'param_value', 'push_gateway_type']
+            label_values = [reporter_name, reporter_value, 'parameter']
+            gauge_name = REPORTER_PUSH_GATEWAY_METRIC_PARAMETER + "_" + reporter_name
+            gauge_value = 1
+
+        if gauge_name not in self._gauges:
+            gauge = Gauge(name=gauge_name, documentation="",labelnames=label_names, registry=self.registry)
+            self._gauges[gauge_name] = (gauge, label_values)
+        else:
+            gauge, previous = self._gauges[gauge_name]
+
+            # parameter values are labels, so a previous value
+            # should be removed rather than being pushed as well
+            if previous != label_values:
+                gauge.remove(*previous)
+                self._gauges[gauge_name] = (gauge, label_values)
+
+        gauge.labels(*label_values).set(gauge_value)
+
+    def count(self, counters):
+        """ Set the reporter self-metric of the message counters """
+        if REPORTER_PUSH_GATEWAY_MESSAGES not in self._gauges:
+            gauge = Gauge(name=REPORTER_PUSH_GATEWAY_MESSAGES, documentation="", labelnames=['state'], registry=self.registry)
+            self._gauges[REPORTER_PUSH_GATEWAY_MESSAGES] = (gauge, None)
+
+        gauge, _ = self._gauges[REPORTER_PUSH_GATEWAY_MESSAGES]
+
+        for state in ['dropped', 'coalesced', 'pushed']:
+            gauge.labels(state).set(getattr(counters, state))
+
+    def push(self, reports, force=False):
+        """ Push the reports along with any previous reports that were not pushed yet
+
+        Returns the number of reports that were pushed.
+        If `force` is set, pushes even if the Pushgateway is being backed off.
+        """
+        failed = set() # (name, type) pairs that could not be set; a single bad report should not drop the rest of the batch
+
+        for reporter_name, reporter_value, report_type in coalesce(reports):
+            try:
+                self.set(reporter_name, reporter_value, report_type)
+            except Exception as e:
+                runai.utils.log.error('Failed setting %s %s to %s (%s); dropping it', report_type.name, reporter_name, reporter_value, e)
+                failed.add((reporter_name, report_type))
 
-        push.failures = 0
-    except IOError as e:
-        runai.utils.log.error('Failed pushing registry to push gateway (%s)', e)
-        push.failures += 1
+        self._unpushed += len([report for report in reports if (report[0], report[2]) not in failed])
 
-push.failures = 0
+        if self._unpushed == 0 or (not force and time.time() < self._retry):
+            return 0
 
-class Reporter(multiprocessing.Process):
+        try:
+            pushadd_to_gateway(gateway=os.environ[GATEWAY_URL_KEY], job=PUSH_GATEWAY_JOB_NAME,
+                            registry=self.registry, grouping_key={GROUPING_KEY: os.environ[GROUPING_KEY]},
+                            timeout=TIMEOUT, handler=self.handler)
+        except Exception as e:
+            # every failure (e.g. missing environment variables as well) is backed off,
+            # so the worker would not retry the push in a busy loop
+            self.failures += 1
+
+            delay = min(MAX_BACKOFF, BACKOFF * 2 ** (self.failures - 1))
+            delay = random.uniform(delay / 2, delay) # jitter so that pods would not probe the Pushgateway together
+            self._retry = time.time() + delay
+
+            runai.utils.log.error('Failed pushing registry to push gateway (%s); retrying in %.1f seconds', e, delay)
+
+            if not isinstance(e, IOError):
+                raise
+
+            return 0
+
+        if self.failures > 0:
+            runai.utils.log.info('Pushing registry to push gateway recovered after %d failure(s)', self.failures)
+
+        pushed = self._unpushed
+        self.failures = 0
+        self._retry = 0
+        self._unpushed = 0
+        return pushed
+
+    def pending(self):
+        """ Returns the number of seconds until unpushed reports should be retried, or `None` if there are none """
+        if self._unpushed == 0:
+            return None
+
+        return max(0, self._retry - time.time())
+
+    def close(self):
+        self.handler.close()
+
+def gateway():
+    global GATEWAY
+
+    if GATEWAY is None:
+        GATEWAY = Pushgateway()
+
+    return GATEWAY
+
+def default_sink():
+    """ Returns the default sink: a spool if `reporterSpoolPath` is set, the Pushgateway if its environment variables are set,
+    and a sink that discards the reports otherwise
+    """
+    if SPOOL_PATH_KEY in os.environ:
+        from .spool import Spool # imported here as it depends on this module
+        return Spool(os.environ[SPOOL_PATH_KEY])
+
+    missing = [key for key in [GATEWAY_URL_KEY, GROUPING_KEY] if key not in os.environ]
+
+    if len(missing) > 0:
+        runai.utils.log.warning('Reports will be discarded as %s %s not set (set %s to spool them to a local file)',
+                                ' and '.join(missing), 'is' if len(missing) == 1 else 'are', SPOOL_PATH_KEY)
+        return Discard()
+
+    return Pushgateway()
+
+def push(reporter_name, reporter_value, report_type):
+    push_many([(reporter_name, reporter_value, report_type)])
+
+def push_many(reports):
+    gateway().push(reports)
+
+def drain(queue, size, interval, timeout=None):
+    """ Wait for a message and then gather more messages that arrive in the next `interval` seconds, up to `size` messages
+
+    If `timeout` is passed, waits for the first message for up to `timeout` seconds.
+    Returns the gathered messages and whether a finish (`None`) message was received.
+    """
+    msgs = []
+    deadline = None
+
+    while len(msgs) < size:
+        try:
+            if deadline is None:
+                msg = queue.get(timeout=timeout)
+                deadline = time.time() + interval
+            else:
+                msg = queue.get(timeout=max(0, deadline - time.time()))
+        except Empty:
+            break
+
+        if msg is None:
+            return msgs, True
+
+        msgs.append(msg)
+
+    return msgs, False
+
+class Reporter(object):
     @staticmethod
-    def _impl(queue):
-        while True:
-            msg = queue.get()
+    def _impl(queue, counters, sink):
+        # the worker keeps its own sink (e.g. registry and connection) for its whole lifetime
+        sink = sink or default_sink()
 
-            if msg is None:
-                # a `None` message tells us that the job is done
-                # successfully and we can finish running
-                break
+        while True:
+            # we push the messages in batches so the push rate (and its cost)
+            # would not depend on the rate of the reports
+            # we also wake up when unpushed reports should be retried
+            msgs, done = drain(queue, BATCH_SIZE, FLUSH_INTERVAL, timeout=sink.pending())
 
-            # we catch all errors as this process should
+            # we catch all errors as the worker should
             # be running until told to stop
             try:
-                push(*msg)
+                sink.count(counters)
+
+                # when finishing, we make a last attempt to push the latest values
+                counters.pushed += sink.push(unpack(msgs), force=done)
             except:
                 pass
 
-    def __init__(self):
-        # create a shared queue for this process and the worker process
-        self._queue = multiprocessing.Queue()
+            if done:
+                # a `None` message tells us that the job is done
+                # successfully and we can finish running
+                break
 
-        # initialize the process and pass the shared queue
-        super(Reporter, self).__init__(target=Reporter._impl, args=(self._queue,))
+        sink.close()
+
+    def __init__(self, maxsize=None, overflow=None, backend=None, sink=None):
+        """ Create a reporter
+
+        arguments:
+          - maxsize (optional): The maximum number of queued messages (a single report, or all reports of a `report_many` call); 0 means unbounded. Defaults to `QUEUE_SIZE`.
+          - overflow (optional): An `Overflow` behavior for when the queue is full. Defaults to `OVERFLOW`.
+          - backend (optional): A `Backend` (or its name) to push from. Defaults to the `reporterBackend` environment variable, or to a worker process.
+          - sink (optional): A `Sink` to push the reports to. Defaults to `default_sink()`, which is created by the worker.
+        """
+        self._maxsize = QUEUE_SIZE if maxsize is None else maxsize
+        self._overflow = OVERFLOW if overflow is None else overflow
+        self._pending = collections.OrderedDict() # reports held back when coalescing
+        self.counters = Counters()
+        self.backend = Backend(backend or os.environ.get(BACKEND_KEY, Backend.process.value))
+
+        # create a shared queue for this process and the worker, and pass it to the worker with the counters
+        if self.backend is Backend.process:
+            self._queue = multiprocessing.Queue(self._maxsize)
+            self._worker = multiprocessing.Process(target=Reporter._impl, args=(self._queue, self.counters, sink))
+        else:
+            # `SimpleQueue` does not take any Python-level lock but could not be bounded
+            self._queue = queue.Queue(self._maxsize) if self._maxsize > 0 else queue.SimpleQueue()
+            self._worker = threading.Thread(target=Reporter._impl, args=(self._queue, self.counters, sink))
+
+    @property
+    def pid(self):
+        return self._worker.pid if self.backend is Backend.process else os.getpid()
+
+    @property
+    def daemon(self):
+        return self._worker.daemon
 
     def start(self, daemon):
-        self.daemon = daemon
-        super(Reporter, self).start()
+        self._worker.daemon = daemon
+        self._worker.start()
 
-        runai.utils.log.debug('Started reporting worker process (%d)', self.pid)
+        runai.utils.log.debug('Started reporting worker %s (%d)', self.backend.value, self.pid)
 
     def finish(self):
-        # tell the worker process to finish
+        # send all held back reports and tell the worker to finish
+        for msg in self._pending.values():
+            self._queue.put(msg)
+        self._pending.clear()
+
         self.send(None)
 
         # wait for it to finish
-        self.join()
+        self._worker.join()
 
-        runai.utils.log.debug('Reporting process (%d) finished', self.pid)
+        runai.utils.log.debug('Reporting %s (%d) finished', self.backend.value, self.pid)
 
     def __enter__(self):
         # when running in a managed context (i.e. using Python `with` keyword),
@@ -108,7 +374,57 @@ class Reporter(multiprocessing.Process):
         self.finish()
 
     def send(self, msg):
-        self._queue.put(msg)
+        if msg is None or self._maxsize <= 0:
+            self._queue.put(msg)
+            return
+
+        if self._overflow is Overflow.coalesce:
+            self._flush()
+
+            # reports must not overtake previous reports that were held back
+            if len(self._pending) == 0 and self._put(msg):
+                return
+
+            for report in unpack([msg]):
+                key = (report[0], report[2])
+                if key in self._pending:
+                    self.counters.coalesced += 1
+                    del self._pending[key]
+                self._pending[key] = report
+
+        elif self._overflow is Overflow.drop_oldest:
+            if self._put(msg):
+                return
+
+            try:
+                self.counters.dropped += len(unpack([self._queue.get_nowait()]))
+            except Empty:
+                pass
+
+            # the worker might have not consumed the reports yet, in which case we drop the new one
+            if not self._put(msg):
+                self.counters.dropped += len(unpack([msg]))
+
+        elif self._overflow is Overflow.drop_newest:
+            if not self._put(msg):
+                self.counters.dropped += len(unpack([msg]))
+
+        else:
+            raise ValueError('Unrecognized overflow %s' % str(self._overflow))
+
+    def _put(self, msg):
+        try:
+            self._queue.put_nowait(msg)
+            return True
+        except Full:
+            return False
+
+    def _flush(self):
+        while len(self._pending) > 0:
+            key = next(iter(self._pending))
+            if not self._put(self._pending[key]):
+                break
+            del self._pending[key]
 
     def reportMetric(self, name, value):
         self.send((name, value, ReportType.metric))
@@ -116,7 +432,20 @@ class Reporter(multiprocessing.Process):
     def reportParameter(self, name, value):
         self.send((name, value, ReportType.parameter))
 
+    def report_many(self, metrics=None, parameters=None):
+        """ Report multiple metrics and parameters given as dictionaries of names to values
+
+        All reports are sent as a single message and are pushed together.
+        """
+        msg = pack(metrics, parameters)
+
+        if len(msg) > 0:
+            self.send(msg)
+
 def send(*args):
+    reporter().send(args)
+
+def reporter():
     global REPORTER
 
     if REPORTER is None:
@@ -131,7 +460,7 @@ def send(*args):
         # successfully processed and pushed
         REPORTER.start(daemon=True)
 
-    REPORTER.send(args)
+    return REPORTER
 
 def finish():
     global REPORTER
@@ -0,0 +1,29 @@
+class Sink(object):
+    """ A destination for reports, used by the reporting worker
+
+    Sinks are created in the reporting process and are used only from the worker.
+    """
+
+    def push(self, reports, force=False):
+        """ Push the reports and return the number of reports that were pushed (possibly including previous ones)
+
+        If `force` is set, the sink should push even if it would otherwise defer it (e.g. when finishing).
+        """
+        raise NotImplementedError()
+
+    def pending(self):
+        """ Returns the number of seconds until deferred reports should be pushed, or `None` if there are none """
+        return None
+
+    def count(self, counters):
+        """ Record the reporter message counters """
+        pass
+
+    def close(self):
+        pass
+
+class Discard(Sink):
+    """ Discards the reports; used when there is nowhere to push them to """
+
+    def push(self, reports, force=False):
+        return 0
@@ -0,0 +1,90 @@
+import json
+import os
+import time
+
+import runai.utils
+
+from . import report_promethues
+from .report_promethues import Pushgateway, ReportType
+from .sink import Sink
+
+class Spool(Sink):
+    """ Appends reports to a local JSON lines file
+
+    Every batch of reports is written at once and is synced to the disk once.
+    The spool keeps the full history of the reports and could later be pushed using `replay`.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = None # opened upon the first push so the spool could be passed to the worker
+
+    def push(self, reports, force=False):
+        if len(reports) == 0:
+            return 0
+
+        if self._file is None:
+            self._file = open(self.path, 'a')
+
+        now = time.time()
+        lines = []
+
+        # every report is serialized by itself, so a single bad report does not drop the rest of the batch
+        for reporter_name, reporter_value, report_type in reports:
+            try:
+                lines.append(json.dumps(dict(
+                    name=reporter_name,
+                    value=float(reporter_value) if report_type is ReportType.metric else str(reporter_value),
+                    type=report_type.name,
+                    time=now,
+                )) + '\n')
+            except Exception as e:
+                runai.utils.log.error('Failed spooling %s %s with value %r (%s); dropping it', report_type.name, reporter_name, reporter_value, e)
+
+        if len(lines) == 0:
+            return 0
+
+        self._file.write(''.join(lines))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+        return len(lines)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def read(path):
+    """ Returns the reports in a spool file """
+    reports = []
+
+    with open(path, 'r') as f:
+        for line in f:
+            try:
+                report = json.loads(line)
+            except ValueError:
+                continue # a torn line of a process that was killed while writing
+
+            reports.append((report['name'], report['value'], ReportType[report['type']]))
+
+    return reports
+
+def replay(path, sink=None):
+    """ Push the reports of a spool file
+
+    arguments:
+      - path: The path of the spool file.
+      - sink (optional): The sink to push the reports to. Defaults to the Pushgateway.
+
+    Returns the number of reports that were pushed.
+    """
+    sink = sink or Pushgateway()
+    reports = read(path)
+
+    pushed = 0
+    for i in range(0, len(reports), report_promethues.BATCH_SIZE):
+        pushed += sink.push(reports[i:i + report_promethues.BATCH_SIZE], force=True)
+
+    sink.close()
+    return pushed
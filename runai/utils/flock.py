@@ -1,28 +1,100 @@
+import errno
 import fcntl
 import os
+import random
+import time
+
+from . import log
+
+MAX_BACKOFF = 1 # the maximum seconds to sleep between attempts to take a lock with a timeout
+SLOW = 1 # the seconds of waiting for a lock from which waits are logged
 
 class Flock(object):
     """ A utility class for advisory lock files
+
+    arguments:
+      - path: The path of the lock file. It is created if it does not exist.
+      - shared (optional): Take a shared lock, that could be held by many processes at once, rather than an exclusive one.
+      - timeout (optional): Seconds to wait for the lock before raising `TimeoutError`. Waits indefinitely if `None` (default).
+      - backoff (optional): Seconds to sleep between attempts to take the lock when `timeout` is set. Doubled (with jitter) upon every failed attempt, up to MAX_BACKOFF.
+
+    The seconds waited for the lock are kept in `waited` (of the last acquisition) and in `total` (of all acquisitions),
+    and the number of acquisitions in `acquisitions`.
     """
 
-    def __init__(self, path):
+    def __init__(self, path, shared=False, timeout=None, backoff=0.01):
         self._path = path
+        self.shared = shared
+        self.timeout = timeout
+        self.backoff = backoff
+        self.waited = 0
+        self.total = 0
+        self.acquisitions = 0
 
-    def __enter__(self):
-        self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT | os.O_TRUNC)
+    def acquire(self, shared=None, timeout=None):
+        """ Take the lock
+
+        arguments:
+          - shared (optional): Overrides `shared` of the lock for this acquisition.
+          - timeout (optional): Overrides `timeout` of the lock for this acquisition.
+        """
+        shared = self.shared if shared is None else shared
+        timeout = self.timeout if timeout is None else timeout
+        operation = fcntl.LOCK_SH if shared else fcntl.LOCK_EX
+
+        # the lock file is never written, so it is not truncated
+        self._fd = os.open(self._path, os.O_RDWR | os.O_CREAT)
+
+        start = time.time()
 
         try:
-            fcntl.flock(self._fd, fcntl.LOCK_EX)
+            if timeout is None:
+                fcntl.flock(self._fd, operation)
+            else:
+                self._poll(operation, start + timeout)
         except (IOError, OSError):
             os.close(self._fd)
             raise
 
-    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.waited = time.time() - start
+        self.total += self.waited
+        self.acquisitions += 1
+
+        if self.waited >= SLOW:
+            log.debug('Waited %.3f seconds for %s lock %s', self.waited, 'shared' if shared else 'exclusive', self._path)
+
+    def _poll(self, operation, deadline):
+        backoff = self.backoff
+
+        while True:
+            try:
+                fcntl.flock(self._fd, operation | fcntl.LOCK_NB)
+                return
+            except (IOError, OSError) as e:
+                if e.errno not in (errno.EAGAIN, errno.EACCES):
+                    raise
+
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise TimeoutError('Could not take lock %s' % self._path)
+
+            time.sleep(min(remaining, random.uniform(0, backoff)))
+            backoff = min(backoff * 2, MAX_BACKOFF)
+
+    def release(self):
+        """ Release the lock """
         try:
             fcntl.flock(self._fd, fcntl.LOCK_UN)
         finally:
             os.close(self._fd)
 
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
 # NOTE:
 # `flock()` did not work over NFS in Linux kernels up to 2.6.11 but works in later Linux kernels.
 # This is discussed around the internet and is documented here: https://www.man7.org/linux/man-pages/man2/flock.2.html.
@@ -0,0 +1,918 @@
+import itertools
+import math
+import os
+import shutil
+import signal
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+
+import yaml
+
+import runai.hpo
+import runai.hpo.journal
+import runai.hpo.leases
+import runai.hpo.tpe
+from runai.utils import Hook, random
+
+GRID = dict(
+    batch_size=[32, 64, 128],
+    lr=[1, 0.1, 0.01, 0.001],
+)
+
+class Load(Hook):
+    def __init__(self):
+        super(Load, self).__init__(yaml, 'load')
+        self.count = 0
+
+    def __hook__(self, *args, **kwargs):
+        self.count += 1
+        return self.__original__(*args, **kwargs)
+
+class HPOTest(unittest.TestCase):
+    backend = 'yaml'
+
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.sigterm = signal.getsignal(signal.SIGTERM)
+
+    def tearDown(self):
+        runai.hpo._release()
+        signal.signal(signal.SIGTERM, self.sigterm)
+        shutil.rmtree(self.root)
+
+        for attr in ['experiment', 'buffer', 'stopping', 'model', 'sampler', 'checkpointers', 'claimed', 'epochs', 'worker']:
+            if hasattr(runai.hpo, attr):
+                delattr(runai.hpo, attr)
+
+    def _init(self, **kwargs):
+        # every initialization acts as a separate worker of the experiment
+        runai.hpo.init(self.root, backend=self.backend, **kwargs)
+
+    def _pick(self, strategy=runai.hpo.Strategy.GridSearch, grid=GRID, **kwargs):
+        self._init()
+
+        if strategy in [runai.hpo.Strategy.SuccessiveHalving, runai.hpo.Strategy.TPE]:
+            kwargs.setdefault('metric', 'accuracy')
+
+        return runai.hpo.pick(grid=grid, strategy=strategy, **kwargs)
+
+    def _experiments(self):
+        with runai.hpo.backend as backend:
+            return [dict(experiment) for experiment in backend.experiments()]
+
+    def _preempt(self):
+        with self.assertRaises(SystemExit):
+            signal.getsignal(signal.SIGTERM)(signal.SIGTERM, None)
+
+    def testGridSearch(self):
+        configs = [self._pick() for _ in range(12)]
+
+        self.assertEqual(len(configs), 12)
+        for config in configs:
+            self.assertEqual(configs.count(config), 1)
+            self.assertIn(config['batch_size'], GRID['batch_size'])
+            self.assertIn(config['lr'], GRID['lr'])
+
+        with self.assertRaises(AssertionError):
+            self._pick()
+
+    def testGridOrder(self):
+        configs = [self._pick() for _ in range(12)]
+        self.assertEqual(configs, [dict(batch_size=batch_size, lr=lr) for batch_size, lr in itertools.product(GRID['batch_size'], GRID['lr'])])
+
+    def testLargeGrid(self):
+        # a grid of 10^12 combinations is not enumerated in advance
+        grid = { random.string(): list(range(100)) for _ in range(6) }
+
+        for _ in range(random.number(2, 5)):
+            self._pick(grid=grid)
+
+        self.assertEqual([experiment['id'] for experiment in self._experiments()], list(range(1, runai.hpo.experiment['id'] + 1)))
+        self.assertEqual(list(runai.hpo.experiment['config'].values()), [0] * 5 + [runai.hpo.experiment['id'] - 1])
+
+    def testEagerGrid(self):
+        # a state whose grid was created in advance (by older versions) is still picked from
+        with open(os.path.join(self.root, 'runai.yaml'), 'w') as f:
+            yaml.dump(dict(
+                creationTime=runai.hpo.now(),
+                experiments=[dict(id=id, status=runai.hpo.Status.Unassigned, config=dict(batch_size=batch_size, lr=lr)) for id, (batch_size, lr) in enumerate(itertools.product(GRID['batch_size'], GRID['lr']), start=1)],
+            ), f)
+
+        configs = [self._pick() for _ in range(12)]
+        self.assertEqual(configs[0], dict(batch_size=32, lr=1))
+        self.assertEqual(len(self._experiments()), 12)
+
+        with self.assertRaises(AssertionError):
+            self._pick()
+
+    def testRandomSearch(self):
+        for i in range(random.number(2, 12)): # configurations are not picked twice, and there are 12 in the grid
+            config = self._pick(runai.hpo.Strategy.RandomSearch)
+            self.assertIn(config['batch_size'], GRID['batch_size'])
+            self.assertEqual(runai.hpo.experiment['id'], i + 1)
+
+    def testReport(self):
+        for strategy in runai.hpo.Strategy:
+            self._pick(strategy)
+
+            epochs = random.number(2, 20)
+            for epoch in range(epochs):
+                runai.hpo.report(epoch, dict(accuracy=epoch / 100.))
+
+            experiment = [experiment for experiment in self._experiments() if experiment['id'] == runai.hpo.experiment['id']][0]
+            self.assertEqual([report['epoch'] for report in experiment['reports']], list(range(epochs)))
+            self.assertEqual(experiment['reports'][-1]['metrics'], dict(accuracy=(epochs - 1) / 100.))
+
+            shutil.rmtree(self.root)
+            os.mkdir(self.root)
+
+    def _reports(self):
+        return [report['epoch'] for report in self._experiments()[0].get('reports', [])]
+
+    def testBufferedReports(self):
+        every = random.number(2, 5)
+        self._init(flush_every=every)
+        runai.hpo.pick(grid=GRID, strategy=runai.hpo.Strategy.GridSearch)
+
+        for epoch in range(every * 2):
+            runai.hpo.report(epoch, dict(accuracy=0.5))
+            self.assertEqual(self._reports(), list(range((epoch + 1) // every * every)))
+
+        runai.hpo.report(every * 2, dict(accuracy=0.5))
+        runai.hpo.flush()
+        self.assertEqual(self._reports(), list(range(every * 2 + 1)))
+
+    def testFlushInterval(self):
+        self._init(flush_every=None, flush_interval=0.1)
+        runai.hpo.pick(grid=GRID, strategy=runai.hpo.Strategy.GridSearch)
+
+        runai.hpo.report(0, dict(accuracy=0.5))
+        self.assertEqual(self._reports(), [])
+
+        time.sleep(0.1)
+        runai.hpo.report(1, dict(accuracy=0.5))
+        self.assertEqual(self._reports(), [0, 1])
+
+    def testPreemptionFlush(self):
+        self._init(flush_every=None)
+        runai.hpo.pick(grid=GRID, strategy=runai.hpo.Strategy.GridSearch)
+
+        for epoch in range(random.number(2, 5)):
+            runai.hpo.report(epoch, dict(accuracy=0.5))
+
+        self._preempt()
+        self.assertEqual(self._reports(), list(range(epoch + 1)))
+        self.assertEqual(runai.hpo.buffer.reports, [])
+
+    def testPreemption(self):
+        for strategy in runai.hpo.Strategy:
+            config = self._pick(strategy)
+            id = runai.hpo.experiment['id']
+            self._preempt()
+
+            self.assertEqual([experiment['status'] for experiment in self._experiments() if experiment['id'] == id], [runai.hpo.Status.Preempted])
+
+            # the preempted experiment is continued by the next worker
+            self.assertEqual(self._pick(strategy), config)
+            self.assertEqual(runai.hpo.experiment['id'], id)
+            self.assertEqual(runai.hpo.experiment['status'], runai.hpo.Status.Assigned)
+
+    def testParseCache(self):
+        if self.backend == 'sqlite':
+            self.skipTest('The state is not kept in YAML')
+
+        self._pick()
+        worker = runai.hpo.backend
+
+        with Load() as load:
+            for _ in range(random.number(2, 5)):
+                with worker:
+                    pass
+
+            self.assertEqual(load.count, 0)
+
+            # the state is parsed again once it is changed by another worker
+            self._pick()
+            self._pick()
+
+            with worker:
+                self.assertEqual(len(worker.experiments()), 3)
+
+    def testTuples(self):
+        grid = dict(layers=[(32, 32), (64, 64)], shapes=[[(1, 2), (3, (4, 5))]])
+        self.assertEqual(self._pick(grid=grid), dict(layers=(32, 32), shapes=[(1, 2), (3, (4, 5))]))
+
+        self._init()
+        with runai.hpo.backend as backend:
+            self.assertEqual(backend.experiment(1)['config'], dict(layers=(32, 32), shapes=[(1, 2), (3, (4, 5))]))
+            self.assertIsInstance(backend.experiment(1)['config']['layers'], tuple)
+
+    def testSnapshot(self):
+        self._init()
+        self.assertIsNone(runai.hpo.backend.snapshot())
+
+        for strategy in runai.hpo.Strategy:
+            self._pick(strategy)
+            runai.hpo.report(0, dict(accuracy=0.5))
+
+        with runai.hpo.backend as backend:
+            expected = [dict(experiment) for experiment in backend.experiments()]
+
+        # the snapshot is read without the lock (by another worker)
+        self._init()
+        self.assertEqual(runai.hpo.backend.snapshot()['experiments'], expected)
+
+    def testInterruptedWrite(self):
+        if self.backend == 'sqlite':
+            self.skipTest('The state is not kept in YAML')
+
+        class Dump(Hook):
+            def __init__(self):
+                super(Dump, self).__init__(yaml, 'dump')
+
+            def __hook__(self, *args, **kwargs):
+                raise KeyboardInterrupt() # as if the worker was killed while writing
+
+        self._pick()
+        with open(os.path.join(self.root, 'runai.yaml'), 'r') as f:
+            content = f.read()
+
+        for _ in range(runai.hpo.journal.COMPACTION if self.backend == 'journal' else 1):
+            with Dump():
+                try:
+                    runai.hpo.report(0, dict(accuracy=0.5))
+                except KeyboardInterrupt:
+                    break
+
+        with open(os.path.join(self.root, 'runai.yaml'), 'r') as f:
+            self.assertEqual(f.read(), content)
+
+    def testExperiments(self):
+        self._init()
+        self.assertEqual(runai.hpo.experiments(), [])
+
+        for _ in range(random.number(2, 5)):
+            self._pick()
+        runai.hpo.report(0, dict(accuracy=0.5))
+        self._preempt()
+
+        # readers do not block each other
+        reader = runai.hpo.backend
+        reader.flock.timeout = 1
+
+        with reader.shared():
+            self._init()
+            runai.hpo.backend.flock.timeout = 1
+            experiments = runai.hpo.experiments()
+
+        self.assertEqual(experiments, self._experiments())
+        self.assertEqual(experiments[-1]['reports'][0]['metrics'], dict(accuracy=0.5))
+        self.assertEqual(runai.hpo.experiments([runai.hpo.Status.Preempted]), experiments[-1:])
+
+    def testSharedReadOnly(self):
+        self._pick()
+
+        with self.assertRaises((AssertionError, sqlite3.OperationalError)):
+            with runai.hpo.backend.shared() as backend:
+                backend.update(1, status=runai.hpo.Status.Preempted)
+
+        self.assertEqual(self._experiments()[0]['status'], runai.hpo.Status.Assigned)
+
+    def testSuccessiveHalving(self):
+        accuracies = [0.1, 0.5, 0.05, 0.7, 0.01]
+        stops = []
+
+        for accuracy in accuracies:
+            self._pick(runai.hpo.Strategy.SuccessiveHalving, eta=2, min_epochs=2)
+
+            # only rungs (epochs 2, 4, 8...) could stop experiments
+            self.assertFalse(runai.hpo.report(1, dict(accuracy=0)))
+            self.assertFalse(runai.hpo.report(3, dict(loss=1)))
+            stops.append(runai.hpo.report(2, dict(accuracy=accuracy)))
+
+        # every experiment is compared to the top half of the ones that reached the rung before it
+        self.assertEqual(stops, [False, False, True, False, True])
+
+        experiments = self._experiments()
+        self.assertEqual([experiment['status'] for experiment in experiments], [runai.hpo.Status.Stopped if stop else runai.hpo.Status.Assigned for stop in stops])
+        self.assertEqual([experiment['rungs'] for experiment in experiments], [{ '2': accuracy } for accuracy in accuracies])
+
+        # stopped experiments are not continued
+        self._preempt()
+        self._pick(runai.hpo.Strategy.SuccessiveHalving)
+        self.assertEqual(runai.hpo.experiment['id'], len(accuracies) + 1)
+
+    def testSuccessiveHalvingMin(self):
+        self._pick(runai.hpo.Strategy.SuccessiveHalving, metric='loss', mode='min')
+        self.assertFalse(runai.hpo.report(1, dict(loss=0.5)))
+
+        self._pick(runai.hpo.Strategy.SuccessiveHalving)
+        self.assertTrue(runai.hpo.report(1, dict(loss=0.6)))
+
+    def testSuccessiveHalvingArguments(self):
+        self._init()
+
+        for kwargs in [dict(), dict(metric='accuracy', mode='average'), dict(metric='accuracy', eta=1), dict(metric='accuracy', min_epochs=0)]:
+            with self.assertRaises(ValueError):
+                runai.hpo.pick(grid=GRID, strategy=runai.hpo.Strategy.SuccessiveHalving, **kwargs)
+
+    def testTPE(self):
+        startup, runai.hpo.tpe.STARTUP = runai.hpo.tpe.STARTUP, 4
+        configs = []
+
+        try:
+            for _ in range(20):
+                config = self._pick(runai.hpo.Strategy.TPE)
+                runai.hpo.report(0, dict(accuracy=(1 if config['lr'] == 0.01 else 0)))
+                configs.append(config)
+        finally:
+            runai.hpo.tpe.STARTUP = startup
+
+        # once the model has enough experiments, it proposes the good learning rate
+        self.assertGreater([config['lr'] for config in configs[4:]].count(0.01), 8)
+
+    def testTPEDirectories(self):
+        runai.hpo.init(self.root, subdir='a', backend=self.backend)
+        for _ in range(2):
+            runai.hpo.pick(grid=GRID, strategy=runai.hpo.Strategy.TPE, metric='accuracy')
+            runai.hpo.report(0, dict(accuracy=0.5))
+
+        self.assertEqual(runai.hpo.model.scores, { 1: 0.5 })
+
+        # the model of another experiment directory is not used, as its experiments have other ids
+        runai.hpo.init(self.root, subdir='b', backend=self.backend)
+        runai.hpo.pick(grid=GRID, strategy=runai.hpo.Strategy.TPE, metric='accuracy')
+        self.assertEqual(runai.hpo.model.root, os.path.join(self.root, 'b'))
+        self.assertEqual(runai.hpo.model.scores, {})
+
+    def testTPECache(self):
+        model = runai.hpo.tpe.TPE(GRID, 'loss', 'min')
+        experiments = [dict(id=1, config=dict(batch_size=32, lr=1), reports=[dict(metrics=dict(loss=0.5))])]
+
+        model.observe(experiments)
+        densities = model.fit()
+
+        # no new scores
+        experiments[0]['reports'].append(dict(metrics=dict(loss=0.7)))
+        model.observe(experiments)
+        self.assertIs(model.fit(), densities)
+        self.assertEqual(model.scores, { 1: 0.5 })
+
+        # a new score
+        experiments.append(dict(id=2, config=dict(batch_size=64, lr=0.1), reports=[dict(metrics=dict(loss=0.1))]))
+        model.observe(experiments)
+        self.assertIsNot(model.fit(), densities)
+        self.assertEqual(model.scores, { 1: 0.5, 2: 0.1 })
+
+        good, bad = model.fit()['lr']
+        self.assertGreater(good.pdf(GRID['lr'].index(0.1)), bad.pdf(GRID['lr'].index(0.1)))
+
+    def testTPEDistributions(self):
+        grid = dict(lr=runai.hpo.LogUniform(1e-5, 1), layers=runai.hpo.IntRange(1, 8))
+        startup, runai.hpo.tpe.STARTUP = runai.hpo.tpe.STARTUP, 4
+        configs = []
+
+        try:
+            for _ in range(20):
+                config = self._pick(runai.hpo.Strategy.TPE, grid=grid)
+                runai.hpo.report(0, dict(accuracy=-abs(math.log10(config['lr']) + 3)))
+                configs.append(config)
+        finally:
+            runai.hpo.tpe.STARTUP = startup
+
+        for config in configs:
+            self.assertTrue(1e-5 <= config['lr'] <= 1)
+            self.assertIn(config['layers'], range(1, 9))
+
+        # proposals are closer to the best learning rate (1e-3) than random ones
+        self.assertLess(sorted(abs(math.log10(config['lr']) + 3) for config in configs[4:])[6], 1)
+
+    def testDistributions(self):
+        grid = dict(
+            lr=runai.hpo.LogUniform(1e-5, 1e-1),
+            momentum=runai.hpo.Uniform(0.5, 0.99),
+            layers=runai.hpo.IntRange(2, 16, step=2),
+            optimizer=runai.hpo.Categorical(['sgd', 'adam'], weights=[1, 0]),
+        )
+
+        for _ in range(random.number(5, 20)):
+            config = self._pick(runai.hpo.Strategy.RandomSearch, grid=grid)
+
+            self.assertTrue(1e-5 <= config['lr'] <= 1e-1)
+            self.assertTrue(0.5 <= config['momentum'] <= 0.99)
+            self.assertIn(config['layers'], range(2, 17, 2))
+            self.assertEqual(config['optimizer'], 'sgd')
+
+    def testGridDistributions(self):
+        grid = dict(layers=runai.hpo.IntRange(1, 10 ** 9), optimizer=runai.hpo.Categorical(['sgd', 'adam']))
+
+        self.assertEqual([self._pick(grid=grid) for _ in range(3)], [dict(layers=1, optimizer='sgd'), dict(layers=1, optimizer='adam'), dict(layers=2, optimizer='sgd')])
+
+        # distributions are stored by their encoding
+        self.assertEqual(runai.hpo.backend.snapshot()['grid']['values'][0], dict(distribution='intrange', low=1, high=10 ** 9, step=1))
+
+        with self.assertRaises(ValueError):
+            self._pick(grid=dict(lr=runai.hpo.Uniform(0, 1)))
+
+    def testDistributionEncoding(self):
+        for distribution in [runai.hpo.Uniform(0, 1), runai.hpo.LogUniform(1e-3, 1), runai.hpo.IntRange(0, 10, 5), runai.hpo.Categorical([1, 2], [3, 4]), runai.hpo.Categorical(['a'])]:
+            self.assertEqual(runai.hpo.distributions.decode(distribution.encode()), distribution)
+
+        self.assertEqual(list(runai.hpo.IntRange(0, 10, 5)), [0, 5, 10])
+
+        for args in [(1, 0), (0, 1, 0)]:
+            with self.assertRaises(ValueError):
+                runai.hpo.IntRange(*args)
+
+        with self.assertRaises(ValueError):
+            runai.hpo.LogUniform(0, 1)
+
+        with self.assertRaises(ValueError):
+            runai.hpo.Categorical([1, 2], [1])
+
+    def _write(self, content):
+        def write(path):
+            with open(os.path.join(path, 'checkpoint'), 'w') as f:
+                f.write(content)
+        return write
+
+    def _read(self):
+        with open(os.path.join(runai.hpo.latest_checkpoint(), 'checkpoint'), 'r') as f:
+            return f.read()
+
+    def testLastEpoch(self):
+        self._pick()
+
+        for epoch in range(random.number(2, 5)):
+            runai.hpo.report(epoch, dict(accuracy=0.5)) # written upon every report (by default)
+            self.assertEqual(runai.hpo.last_epoch(), epoch)
+
+        runai.hpo.flush()
+        self.assertEqual(runai.hpo.last_epoch(), epoch)
+
+    def testCheckpoint(self):
+        self._pick()
+        self.assertIsNone(runai.hpo.last_epoch())
+        self.assertIsNone(runai.hpo.latest_checkpoint())
+        self.assertEqual(runai.hpo.checkpoint_path(), os.path.join(self.root, 'checkpoints', '1'))
+
+        for epoch in range(random.number(2, 5)):
+            runai.hpo.checkpoint(self._write(str(epoch)))
+            runai.hpo.report(epoch, dict(accuracy=0.5))
+
+        self._preempt()
+
+        # the preempted experiment is continued from its latest checkpoint
+        self._pick()
+        self.assertEqual(runai.hpo.last_epoch(), epoch)
+        self.assertEqual(self._read(), str(epoch))
+
+        # only the latest checkpoint is kept
+        self.assertEqual(sorted(os.listdir(runai.hpo.checkpoint_path())), [os.path.basename(runai.hpo.latest_checkpoint()), 'latest'])
+
+        # other experiments have checkpoints of their own
+        self._pick()
+        self.assertIsNone(runai.hpo.latest_checkpoint())
+
+    def testCheckpointCoalescing(self):
+        self._pick()
+        written = []
+        started = threading.Event()
+        proceed = threading.Event()
+
+        def slow(path):
+            started.set()
+            proceed.wait()
+            written.append('slow')
+
+        def write(content):
+            def write(path):
+                written.append(content)
+                self._write(content)(path)
+            return write
+
+        runai.hpo.checkpoint(slow)
+        started.wait()
+
+        for content in random.strings(random.number(2, 5)) + ['last']:
+            runai.hpo.checkpoint(write(content))
+
+        proceed.set()
+        runai.hpo._wait()
+
+        # checkpoints that were requested while writing are replaced by newer ones
+        self.assertEqual(written, ['slow', 'last'])
+        self.assertEqual(self._read(), 'last')
+
+    def testLease(self):
+        self._init(lease=0.3)
+        config = runai.hpo.pick(grid=GRID, strategy=runai.hpo.Strategy.GridSearch)
+        path = os.path.join(self.root, 'leases', '1')
+        self.assertTrue(os.path.isfile(path))
+
+        # the lease is renewed while the worker is alive
+        time.sleep(0.5)
+        self.assertEqual(runai.hpo.leases.expired(os.path.dirname(path), 0.3), [])
+
+        # as if the worker was killed
+        runai.hpo.heartbeat.stop(release=False)
+        runai.hpo.heartbeat = None
+        time.sleep(0.4)
+
+        # the next worker continues the experiment
+        self._init(lease=0.3)
+        self.assertEqual(runai.hpo.pick(grid=GRID, strategy=runai.hpo.Strategy.GridSearch), config)
+        self.assertEqual(runai.hpo.experiment['id'], 1)
+
+        # the lease is released once the worker moves on to another experiment
+        self._pick()
+        self.assertFalse(os.path.isfile(path))
+        self.assertTrue(os.path.isfile(os.path.join(self.root, 'leases', '2')))
+
+    def testLeaseReleased(self):
+        self._init(lease=0.1)
+        runai.hpo.pick(grid=GRID, strategy=runai.hpo.Strategy.GridSearch)
+        runai.hpo._release() # as upon exit
+
+        time.sleep(0.2)
+        self._init(lease=0.1)
+        runai.hpo.pick(grid=GRID, strategy=runai.hpo.Strategy.GridSearch)
+        self.assertEqual(runai.hpo.experiment['id'], 2)
+
+    def testLeaseReclaimed(self):
+        self._init(lease=0.3)
+        runai.hpo.pick(grid=GRID, strategy=runai.hpo.Strategy.GridSearch)
+        path = os.path.join(self.root, 'leases', '1')
+        worker = runai.hpo.worker
+        self.assertEqual(runai.hpo.leases.owner(path), worker)
+
+        # as if this worker stalled and another worker reclaimed the experiment and picked it
+        with runai.hpo.backend as backend:
+            runai.hpo.leases.remove(path, worker)
+            backend.update(1, status=runai.hpo.Status.Assigned, worker='another')
+            runai.hpo.leases.take(path, 'another')
+
+        # the lease of the other worker is not renewed by this one anymore
+        runai.hpo.heartbeat._touch()
+        self.assertEqual(runai.hpo.heartbeat.paths, [])
+
+        # reports and checkpoints of this worker are not written
+        runai.hpo.report(0, dict(accuracy=0.5))
+        self.assertEqual(runai.hpo.worker, worker)
+        self.assertEqual(self._experiments()[0].get('reports', []), [])
+
+        runai.hpo.checkpoint(lambda directory: None, wait=True)
+        self.assertIsNone(runai.hpo.latest_checkpoint())
+
+        # and the lease of the other worker is kept once this one exits
+        runai.hpo._release()
+        self.assertEqual(runai.hpo.leases.owner(path), 'another')
+
+    def testPickMany(self):
+        self._init()
+        experiments = runai.hpo.pick_many(5, grid=GRID, strategy=runai.hpo.Strategy.GridSearch)
+        self.assertEqual([experiment['id'] for experiment in experiments], list(range(1, 6)))
+
+        for experiment in experiments:
+            runai.hpo.report(0, dict(accuracy=experiment['id']), id=experiment['id'])
+
+        self.assertEqual([experiment['reports'][0]['metrics'] for experiment in self._experiments()], [dict(accuracy=id) for id in range(1, 6)])
+
+        # the rest of the grid
+        self.assertEqual(len(runai.hpo.pick_many(10, grid=GRID, strategy=runai.hpo.Strategy.GridSearch)), 7)
+        self.assertEqual(runai.hpo.pick_many(10, grid=GRID, strategy=runai.hpo.Strategy.GridSearch), [])
+
+    def testRandomSearchUnique(self):
+        picked = []
+
+        for _ in range(12): # every worker picks a single experiment
+            picked.append(self._pick(runai.hpo.Strategy.RandomSearch))
+            runai.hpo._release()
+
+        self.assertEqual(sorted(picked, key=lambda config: (config['batch_size'], config['lr'])), [
+            dict(batch_size=batch_size, lr=lr) for batch_size in GRID['batch_size'] for lr in sorted(GRID['lr'])
+        ])
+
+        # the grid was exhausted
+        self.assertEqual(runai.hpo.pick_many(1, grid=GRID, strategy=runai.hpo.Strategy.RandomSearch), [])
+
+    def testRandomSearchTuples(self):
+        grid = dict(shape=[(1, 2), (3, 4), (5, 6)])
+        picked = []
+
+        for _ in range(3): # every worker is a separate process, and indexes all experiments
+            picked.append(self._pick(runai.hpo.Strategy.RandomSearch, grid=grid, seed=1)['shape'])
+            runai.hpo._release()
+            delattr(runai.hpo, 'sampler')
+
+        self.assertEqual(sorted(tuple(shape) for shape in picked), grid['shape'])
+        self.assertEqual(runai.hpo.pick_many(1, grid=grid, strategy=runai.hpo.Strategy.RandomSearch), [])
+
+    def testRandomSearchSeed(self):
+        grid = dict(GRID, dropout=runai.hpo.Uniform(0, 0.5))
+
+        def configs(subdir, seed, n=8):
+            runai.hpo.init(self.root, subdir=subdir, backend=self.backend)
+            return [experiment['config'] for experiment in runai.hpo.pick_many(n, grid=grid, strategy=runai.hpo.Strategy.RandomSearch, seed=seed)]
+
+        self.assertEqual(configs('first', 7), configs('second', 7))
+        self.assertNotEqual(configs('third', 7), configs('fourth', 8))
+
+        # the seed is stored by the first worker
+        runai.hpo.init(self.root, subdir='fifth', backend=self.backend)
+        runai.hpo.pick(grid=grid, strategy=runai.hpo.Strategy.RandomSearch)
+        with runai.hpo.backend as backend:
+            seed = backend.get('seed')
+
+        self.assertIsNotNone(seed)
+        self.assertEqual(configs('fifth', None), configs('sixth', seed, n=9)[1:])
+
+    def testPickManyPreemption(self):
+        self._init()
+        runai.hpo.pick_many(3, grid=GRID, strategy=runai.hpo.Strategy.RandomSearch)
+        self._preempt()
+
+        self.assertEqual([experiment['status'] for experiment in self._experiments()], [runai.hpo.Status.Preempted] * 3)
+
+    def testPickManyCheckpoints(self):
+        self._init()
+        experiments = runai.hpo.pick_many(2, grid=GRID, strategy=runai.hpo.Strategy.GridSearch)
+
+        for experiment in experiments: # run concurrently
+            runai.hpo.checkpoint(self._write(str(experiment['id'])), id=experiment['id'])
+            runai.hpo.report(experiment['id'], dict(accuracy=0.5), id=experiment['id'])
+
+        runai.hpo._wait()
+
+        for experiment in experiments:
+            self.assertEqual(runai.hpo.checkpoint_path(id=experiment['id']), os.path.join(self.root, 'checkpoints', str(experiment['id'])))
+            self.assertEqual(runai.hpo.last_epoch(id=experiment['id']), experiment['id'])
+
+            with open(os.path.join(runai.hpo.latest_checkpoint(id=experiment['id']), 'checkpoint'), 'r') as f:
+                self.assertEqual(f.read(), str(experiment['id']))
+
+    def testTrials(self):
+        self._init()
+        configs = [config for config in runai.hpo.trials(grid=GRID, strategy=runai.hpo.Strategy.GridSearch, batch=5)]
+
+        self.assertEqual(configs, [dict(batch_size=batch_size, lr=lr) for batch_size, lr in itertools.product(GRID['batch_size'], GRID['lr'])])
+        self.assertEqual(runai.hpo.claimed, [])
+
+    def testTrialsBreak(self):
+        self._init()
+
+        for i, config in enumerate(runai.hpo.trials(grid=GRID, strategy=runai.hpo.Strategy.GridSearch, batch=4)):
+            runai.hpo.report(0, dict(accuracy=0.5))
+            self.assertEqual(runai.hpo.experiment['config'], config)
+
+            if i == 1:
+                break
+
+        # experiments that were picked but not run are continued by other workers
+        self.assertEqual([experiment['status'] for experiment in self._experiments()], [runai.hpo.Status.Assigned] * 2 + [runai.hpo.Status.Preempted] * 2)
+        self.assertEqual([len(experiment.get('reports', [])) for experiment in self._experiments()], [1, 1, 0, 0])
+
+    def _column(self, table, name):
+        return list(table[name])
+
+    def testResults(self):
+        self.assertEqual(runai.hpo.results(self.root).trials, {})
+
+        for _ in range(3):
+            self._pick()
+            for epoch in range(random.number(2, 5)):
+                runai.hpo.report(epoch, dict(accuracy=epoch / 10.))
+
+        results = runai.hpo.results(self.root)
+        experiments = self._experiments()
+
+        self.assertEqual(self._column(results.trials, 'id'), [1, 2, 3])
+        self.assertEqual(self._column(results.trials, 'status'), [runai.hpo.Status.Assigned] * 3)
+        self.assertEqual(self._column(results.trials, 'config.lr'), [experiment['config']['lr'] for experiment in experiments])
+        self.assertEqual(self._column(results.trials, 'epochs'), [len(experiment['reports']) for experiment in experiments])
+        self.assertEqual(self._column(results.trials, 'metric.accuracy'), [experiment['reports'][-1]['metrics']['accuracy'] for experiment in experiments])
+        self.assertEqual(self._column(results.reports, 'id'), [experiment['id'] for experiment in experiments for _ in experiment['reports']])
+        self.assertEqual(self._column(results.reports, 'epoch'), [report['epoch'] for experiment in experiments for report in experiment['reports']])
+
+        # results are updated in place, and metrics that were not reported before are filled
+        rows = len(results.reports['id'])
+        epochs = self._column(results.trials, 'epochs')[-1]
+        runai.hpo.report(epoch + 1, dict(loss=0.5))
+        self._preempt()
+
+        self.assertIs(runai.hpo.results(self.root), results)
+        self.assertEqual(len(results.reports['id']), rows + 1)
+        self.assertEqual(self._column(results.reports, 'metric.loss'), [None] * rows + [0.5])
+        self.assertEqual(self._column(results.reports, 'metric.accuracy')[-1], None)
+        self.assertEqual(self._column(results.trials, 'metric.loss'), [None, None, 0.5])
+        self.assertEqual(self._column(results.trials, 'metric.accuracy')[-1], None)
+        self.assertEqual(self._column(results.trials, 'epochs')[-1], epochs + 1)
+        self.assertEqual(self._column(results.trials, 'status'), [runai.hpo.Status.Assigned] * 2 + [runai.hpo.Status.Preempted])
+
+    def testResultsIncremental(self):
+        class Reports(Hook):
+            def __init__(self, backend):
+                super(Reports, self).__init__(backend, 'reports')
+                self.returned = 0
+
+            def __hook__(self, *args, **kwargs):
+                reports, cursor = self.__original__(*args, **kwargs)
+                self.returned += len(reports)
+                return reports, cursor
+
+        self._pick()
+        for epoch in range(random.number(2, 5)):
+            runai.hpo.report(epoch, dict(accuracy=0.5))
+
+        results = runai.hpo.results(self.root)
+
+        with Reports(results.backend) as hook:
+            runai.hpo.results(self.root)
+            self.assertEqual(hook.returned, 0)
+
+            runai.hpo.report(epoch + 1, dict(accuracy=0.5))
+            runai.hpo.results(self.root)
+            self.assertEqual(hook.returned, 1)
+
+    def testResultsNamespaces(self):
+        self._pick()
+        runai.hpo.report(0, dict(lr=99, id=99, epoch=99, status=99))
+
+        results = runai.hpo.results(self.root)
+
+        self.assertEqual(self._column(results.trials, 'id'), [1])
+        self.assertEqual(self._column(results.trials, 'status'), [runai.hpo.Status.Assigned])
+        self.assertEqual(self._column(results.trials, 'config.lr'), [runai.hpo.experiment['config']['lr']])
+        self.assertEqual(self._column(results.trials, 'metric.lr'), [99])
+        self.assertEqual(self._column(results.reports, 'id'), [1])
+        self.assertEqual(self._column(results.reports, 'epoch'), [0])
+        self.assertEqual(self._column(results.reports, 'metric.id'), [99])
+
+    @unittest.skipIf(runai.hpo.analytics.np is None, 'NumPy is not installed')
+    def testResultsNumpy(self):
+        self._pick()
+        for epoch in range(100): # more than the initial capacity of the arrays
+            runai.hpo.report(epoch, dict(accuracy=0.5))
+
+        results = runai.hpo.results(self.root)
+        self.assertEqual(results.reports['metric.accuracy'].dtype.kind, 'f')
+        self.assertEqual(list(results.reports['epoch']), list(range(100)))
+
+        runai.hpo.report(100, dict(loss=0.5)) # a missing value
+        self.assertEqual(runai.hpo.results(self.root).reports['metric.accuracy'][-1], None)
+
+    def testResultsDataFrame(self):
+        try:
+            import pandas
+        except ImportError:
+            self.skipTest('pandas is not installed')
+
+        self._pick()
+        runai.hpo.report(0, dict(accuracy=0.5))
+
+        self.assertEqual(list(runai.hpo.results(self.root).dataframe('reports')['metric.accuracy']), [0.5])
+
+    def testUnrecognizedBackend(self):
+        with self.assertRaises(ValueError):
+            runai.hpo.init(self.root, backend=random.string())
+
+class HPOJournalTest(HPOTest):
+    backend = 'journal'
+
+    def _state(self):
+        with open(os.path.join(self.root, 'runai.yaml'), 'r') as f:
+            return yaml.load(f, Loader=yaml.FullLoader)
+
+    def testJournaledTuples(self):
+        grid = dict(layers=[(32, 32), (64, 64)])
+
+        for _ in range(2): # the second experiment is added by a record of the journal
+            self._pick(grid=grid)
+
+        self._init()
+        with runai.hpo.backend as backend:
+            self.assertEqual([experiment['config'] for experiment in backend.experiments()], [dict(layers=(32, 32)), dict(layers=(64, 64))])
+
+        self.assertEqual([experiment['config'] for experiment in runai.hpo.backend.snapshot()['experiments']], [dict(layers=(32, 32)), dict(layers=(64, 64))])
+
+    def testWorkers(self):
+        # workers see the changes of each other
+        workers = []
+        for _ in range(random.number(2, 5)):
+            self._pick(runai.hpo.Strategy.RandomSearch)
+            workers.append((runai.hpo.backend, runai.hpo.experiment['id']))
+
+        for epoch in range(random.number(2, 10)):
+            for backend, id in workers:
+                with backend:
+                    backend.report(id, dict(epoch=epoch))
+
+        for backend, _ in workers:
+            with backend:
+                for _, id in workers:
+                    self.assertEqual(backend.experiment(id)['reports'], [dict(epoch=epoch) for epoch in range(epoch + 1)])
+
+    def testAppend(self):
+        self._pick()
+        size = os.path.getsize(os.path.join(self.root, 'runai.yaml'))
+
+        for epoch in range(random.number(2, 20)):
+            runai.hpo.report(epoch, dict(accuracy=0.5))
+
+        # reports are not written to the snapshot
+        self.assertEqual(os.path.getsize(os.path.join(self.root, 'runai.yaml')), size)
+        self.assertNotIn('reports', self._state()['experiments'][0])
+
+    def testCompaction(self):
+        self._pick()
+        generation = self._state()['journalGeneration']
+
+        for epoch in range(runai.hpo.journal.COMPACTION):
+            runai.hpo.report(epoch, dict(accuracy=0.5))
+
+        self.assertEqual(self._state()['journalGeneration'], generation + 1)
+        self.assertEqual(len(self._state()['experiments'][0]['reports']), runai.hpo.journal.COMPACTION)
+
+        # other workers reload the compacted state
+        self._pick()
+        self.assertEqual(len(self._experiments()[0]['reports']), runai.hpo.journal.COMPACTION)
+
+    def testTornRecord(self):
+        self._pick()
+        runai.hpo.report(0, dict(accuracy=0.5))
+
+        with open(os.path.join(self.root, 'runai.journal'), 'a') as f:
+            f.write('{"op": "rep')
+
+        # the same worker, continuing after reading the state again
+        worker = runai.hpo.worker
+        self._init()
+        runai.hpo.worker = worker
+        runai.hpo.experiment = self._experiments()[0]
+        runai.hpo.report(1, dict(accuracy=0.5))
+
+        self._init()
+        self.assertEqual([report['epoch'] for report in self._experiments()[0]['reports']], [0, 1])
+
+    def testMigration(self):
+        # an experiment that was started with the YAML backend
+        runai.hpo.init(self.root, backend='yaml')
+        config = runai.hpo.pick(grid=GRID, strategy=runai.hpo.Strategy.GridSearch)
+        runai.hpo.report(0, dict(accuracy=0.5))
+
+        self.assertNotEqual(self._pick(), config)
+        self.assertEqual(len(self._experiments()[0]['reports']), 1)
+        self.assertTrue(os.path.isfile(os.path.join(self.root, 'runai.journal')))
+
+class HPOSQLiteTest(HPOTest):
+    backend = 'sqlite'
+
+    def testMigration(self):
+        # an experiment that was started with the YAML backend
+        runai.hpo.init(self.root, backend='yaml')
+        config = runai.hpo.pick(grid=GRID, strategy=runai.hpo.Strategy.GridSearch)
+        runai.hpo.report(0, dict(accuracy=0.5))
+
+        self.assertNotEqual(self._pick(), config)
+
+        experiments = self._experiments()
+        self.assertEqual(len(experiments), 2)
+        self.assertEqual(experiments[0]['config'], config)
+        self.assertEqual(experiments[0]['reports'][0]['metrics'], dict(accuracy=0.5))
+        self.assertEqual([experiment['status'] for experiment in experiments], [runai.hpo.Status.Assigned] * 2)
+
+    def testRollback(self):
+        self._pick()
+
+        with self.assertRaises(ValueError):
+            with runai.hpo.backend as backend:
+                backend.update(1, status=runai.hpo.Status.Preempted)
+                raise ValueError()
+
+        self.assertEqual(self._experiments()[0]['status'], runai.hpo.Status.Assigned)
+
+    def testFilteredReports(self):
+        self._init()
+        for experiment in runai.hpo.pick_many(3, grid=GRID, strategy=runai.hpo.Strategy.GridSearch):
+            runai.hpo.report(0, dict(accuracy=experiment['id']), id=experiment['id'])
+
+        statements = []
+
+        with runai.hpo.backend as backend:
+            backend.update(2, status=runai.hpo.Status.Preempted)
+
+            backend._connection.set_trace_callback(statements.append)
+            experiments = backend.experiments([runai.hpo.Status.Preempted])
+            backend._connection.set_trace_callback(None)
+
+        self.assertEqual([experiment['id'] for experiment in experiments], [2])
+        self.assertEqual([report['metrics'] for report in experiments[0]['reports']], [dict(accuracy=2)])
+
+        # reports of other experiments are not read
+        self.assertTrue(all('WHERE' in statement for statement in statements if 'FROM reports' in statement))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,72 @@
+import asyncio
+import string
+import unittest
+
+from runai.utils import random
+from runai.reporter import AsyncReporter
+
+from test_reporter_promethues import Mock, ReporterPromethuesBaseTest, random_args
+
+def run(coroutine):
+    return asyncio.new_event_loop().run_until_complete(coroutine)
+
+class AsyncReporterTest(ReporterPromethuesBaseTest):
+    def testCreationScope(self):
+        async def main():
+            async with AsyncReporter() as reporter:
+                self.assertFalse(reporter._task.done())
+
+            self.assertTrue(reporter._task.done())
+
+        run(main())
+
+    def testReport(self):
+        count = random.number(2, 20)
+
+        async def report(reporter):
+            await reporter.report_metric(random.string(chars=string.ascii_letters), random.number())
+            await reporter.report_parameter(random.string(chars=string.ascii_letters), random.string(chars=string.ascii_letters))
+
+        async def main():
+            async with AsyncReporter() as reporter:
+                await asyncio.gather(*[report(reporter) for _ in range(count)])
+
+            return reporter
+
+        with Mock() as mock:
+            reporter = run(main())
+
+        # all reports of all coroutines are pushed together
+        self.assertEqual(mock.count, 1)
+        self.assertEqual(reporter.counters.pushed, count * 2)
+
+    def testReportMany(self):
+        metrics = { name: random.number() for name in random.strings(random.number(2, 10)) if name.isalpha() }
+        parameters = { name: random.string() for name in random.strings(random.number(2, 10)) if name.isalpha() }
+
+        async def main():
+            async with AsyncReporter(maxsize=1) as reporter:
+                await reporter.report_many(metrics, parameters=parameters)
+
+            return reporter
+
+        with Mock():
+            reporter = run(main())
+
+        self.assertEqual(reporter.counters.pushed, len(metrics) + len(parameters))
+
+    def testError(self):
+        async def main():
+            async with AsyncReporter() as reporter:
+                for _ in range(random.number(2, 20)):
+                    await reporter.send(random_args())
+
+        for error in [IOError, ImportError, IndexError, KeyError, ValueError]:
+            with Mock(error):
+                try:
+                    run(main())
+                except:
+                    self.fail('`finish` was not expected to raise an error')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -99,6 +99,13 @@ class KerasAutologTest(unittest.TestCase):
         self._run_test(expected_metrics=expected_metrics, expected_parameters=expected_parameters)
         runai.reporter.keras.disableAutoLog()
 
+    def testFitWithPolicy(self):
+        runai.reporter.keras.autolog(policy=runai.reporter.Policy(every=10, rate=1, delta=0.01))
+        expected_metrics = ['overall_epochs', 'batch_size', 'number_of_layers', 'epoch', 'step', 'accuracy', 'loss']
+        expected_parameters = ['optimizer_name', 'learning_rate']
+        self._run_test(expected_metrics=expected_metrics, expected_parameters=expected_parameters)
+        runai.reporter.keras.disableAutoLog()
+
     def testFitGeneratorWithoutAutoLog(self):
         self._run_test(run_fit=False)
 
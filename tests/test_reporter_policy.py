@@ -0,0 +1,46 @@
+import time
+import unittest
+
+from runai.utils import random
+from runai.reporter import Policy
+
+class PolicyTest(unittest.TestCase):
+    def testDefault(self):
+        policy = Policy()
+
+        for _ in range(random.number()):
+            self.assertTrue(policy.sample())
+            self.assertTrue(policy.changed('loss', random.number()))
+
+    def testEvery(self):
+        every = random.number(2, 10)
+        policy = Policy(every=every)
+
+        sampled = [i for i in range(every * random.number(2, 10)) if policy.sample()]
+        self.assertEqual(sampled, list(range(0, len(sampled) * every, every)))
+
+    def testRate(self):
+        policy = Policy(rate=10)
+
+        self.assertTrue(policy.sample())
+        self.assertFalse(policy.sample())
+
+        time.sleep(0.1)
+        self.assertTrue(policy.sample())
+
+    def testDelta(self):
+        policy = Policy(delta=0.1)
+
+        self.assertTrue(policy.changed('loss', 1.))
+        self.assertFalse(policy.changed('loss', 1.05))
+        self.assertFalse(policy.changed('loss', 0.95))
+        self.assertTrue(policy.changed('loss', 0.8))
+        self.assertTrue(policy.changed('accuracy', 0.9))
+
+    def testInvalid(self):
+        for kwargs in [dict(every=0), dict(rate=0), dict(rate=-1)]:
+            with self.assertRaises(ValueError):
+                Policy(**kwargs)
+
+if __name__ == '__main__':
+    unittest.main()
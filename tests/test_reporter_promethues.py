@@ -1,9 +1,14 @@
+import http.server
+import multiprocessing
 import os
 import string
+import threading
+import time
 import unittest
 
 from runai.utils import Hook, random
 from runai.reporter import report_promethues, Reporter
+from runai.reporter.handler import KeepAliveHandler
 
 def random_args():
     reporter_name = random.string(chars=string.ascii_letters + string.digits)
@@ -43,7 +48,7 @@ class ReporterPromethuesBaseTest(unittest.TestCase):
         del os.environ["reporterGatewayURL"]
 
     def tearDown(self):
-        report_promethues.push.failures = 0
+        report_promethues.GATEWAY = None
 
 class ReporterPromethuesPushTest(ReporterPromethuesBaseTest):
     def _push(self):
@@ -51,7 +56,7 @@ class ReporterPromethuesPushTest(ReporterPromethuesBaseTest):
         report_promethues.push(*args)
 
     def testInitialization(self):
-        self.assertEqual(report_promethues.push.failures, 0)
+        self.assertEqual(report_promethues.gateway().failures, 0)
 
     def testSanity(self):
         with Mock() as mock:
@@ -73,16 +78,240 @@ class ReporterPromethuesPushTest(ReporterPromethuesBaseTest):
                 with self.assertRaises(error):
                     self._push()
 
-    def testErrorCached(self):
+            # other errors are backed off as well
+            self.assertGreater(report_promethues.gateway().pending(), 0)
+            report_promethues.gateway()._retry = 0 # as if the delay has passed
+
+    def testMissingEnvironment(self):
+        class Drain(Hook):
+            def __init__(self):
+                super(Drain, self).__init__(report_promethues, 'drain')
+                self.count = 0
+
+            def __hook__(self, *args, **kwargs):
+                self.count += 1
+                return self.__original__(*args, **kwargs)
+
+        environ = { key: os.environ.pop(key) for key in [report_promethues.GATEWAY_URL_KEY, report_promethues.GROUPING_KEY] }
+
+        try:
+            gateway = report_promethues.gateway()
+
+            with self.assertRaises(KeyError):
+                self._push()
+
+            # the failure is backed off as well
+            self.assertEqual(gateway.failures, 1)
+            self.assertGreater(gateway.pending(), 0)
+
+            # and the worker does not retry it in a busy loop
+            with Drain() as drain:
+                with Reporter(backend='thread', sink=report_promethues.Pushgateway()) as reporter:
+                    reporter.reportMetric(*random_args()[:2])
+                    time.sleep(0.5)
+
+            self.assertLess(drain.count, 10)
+        finally:
+            os.environ.update(environ)
+
+    def testBackoff(self):
+        gateway = report_promethues.gateway()
+
         with Mock(IOError) as mock:
-            for i in range(report_promethues.RETRIES):
-                self.assertEqual(mock.count, i)
+            for i in range(random.number(2, 10)):
                 self._push()
                 self.assertEqual(mock.count, i + 1)
+                self.assertEqual(gateway.failures, i + 1)
+
+                # pushes are skipped while backing off
+                for _ in range(random.number(2, 20)):
+                    self._push()
+                    self.assertEqual(mock.count, i + 1)
 
-            for _ in range(random.number(2, 20)):
+                delay = gateway.pending()
+                self.assertLessEqual(delay, min(report_promethues.MAX_BACKOFF, report_promethues.BACKOFF * 2 ** i))
+                self.assertGreater(delay, min(report_promethues.MAX_BACKOFF, report_promethues.BACKOFF * 2 ** i) / 2 - 1)
+
+                gateway._retry = 0 # as if the delay has passed
+
+    def testRecovery(self):
+        gateway = report_promethues.gateway()
+
+        count = random.number(2, 20)
+
+        with Mock(IOError) as mock:
+            for _ in range(count + 1):
                 self._push()
-                self.assertEqual(mock.count, report_promethues.RETRIES)
+
+            self.assertEqual(mock.count, 1)
+
+        self.assertEqual(gateway.failures, 1)
+        self.assertEqual(gateway._unpushed, count + 1)
+
+        gateway._retry = 0 # as if the delay has passed
+
+        with Mock() as mock:
+            self.assertEqual(gateway.push([]), count + 1)
+            self.assertEqual(mock.count, 1)
+
+        self.assertEqual(gateway.failures, 0)
+        self.assertIsNone(gateway.pending())
+
+    def testForce(self):
+        gateway = report_promethues.gateway()
+
+        with Mock(IOError) as mock:
+            self._push()
+            gateway.push([], force=True)
+            self.assertEqual(mock.count, 2)
+
+    def testPushMany(self):
+        with Mock() as mock:
+            report_promethues.push_many([random_args() for _ in range(random.number(2, 20))])
+            self.assertEqual(mock.count, 1)
+
+    def testCoalesce(self):
+        name = random.string(chars=string.ascii_letters)
+        values = [random.number() for _ in range(random.number(2, 20))]
+
+        reports = [(name, value, report_promethues.ReportType.metric) for value in values]
+        reports.append((name, random.string(chars=string.ascii_letters), report_promethues.ReportType.parameter))
+
+        coalesced = report_promethues.coalesce(reports)
+        self.assertEqual(coalesced, [(name, values[-1], report_promethues.ReportType.metric), reports[-1]])
+
+class ReporterPromethuesPushgatewayTest(ReporterPromethuesBaseTest):
+    def _samples(self, gateway):
+        return [sample for metric in gateway.registry.collect() for sample in metric.samples]
+
+    def testGaugeCached(self):
+        gateway = report_promethues.Pushgateway()
+        name = random.string(chars=string.ascii_letters)
+
+        with Mock() as mock:
+            for i in range(random.number(2, 20)):
+                gateway.push([(name, random.number(), report_promethues.ReportType.metric)])
+                self.assertEqual(mock.count, i + 1)
+                self.assertEqual(len(self._samples(gateway)), 1)
+
+    def testInvalidName(self):
+        gateway = report_promethues.Pushgateway()
+
+        with Mock() as mock:
+            pushed = gateway.push([
+                ('good', 1, report_promethues.ReportType.metric),
+                ('bad name', 2, report_promethues.ReportType.metric),
+                ('after', 3, report_promethues.ReportType.metric),
+            ])
+
+        # only the invalid report is dropped
+        self.assertEqual(mock.count, 1)
+        self.assertEqual(pushed, 2)
+        self.assertEqual(sorted(sample.labels['metric_name'] for sample in self._samples(gateway)), ['after', 'good'])
+
+    def testParameterReplaced(self):
+        gateway = report_promethues.Pushgateway()
+        name = random.string(chars=string.ascii_letters)
+
+        with Mock():
+            for value in random.strings(random.number(2, 10)):
+                gateway.push([(name, value, report_promethues.ReportType.parameter)])
+
+                samples = self._samples(gateway)
+                self.assertEqual(len(samples), 1)
+                self.assertEqual(samples[0].labels['param_value'], value)
+
+    def testCounters(self):
+        gateway = report_promethues.Pushgateway()
+        counters = report_promethues.Counters()
+        counters.dropped = random.number()
+        counters.pushed = random.number()
+
+        gateway.count(counters)
+
+        samples = { sample.labels['state']: sample.value for sample in self._samples(gateway) }
+        self.assertEqual(samples, dict(dropped=counters.dropped, coalesced=0, pushed=counters.pushed))
+
+class ReporterPromethuesKeepAliveHandlerTest(unittest.TestCase):
+    def setUp(self):
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_POST(self):
+                self.rfile.read(int(self.headers['Content-Length']))
+                self.send_response(self.server.code)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        class Server(http.server.ThreadingHTTPServer):
+            code = 200
+            connections = 0
+
+            def process_request(self, request, client_address):
+                self.connections += 1
+                super(Server, self).process_request(request, client_address)
+
+        self.server = Server(('127.0.0.1', 0), Handler)
+        self.url = 'http://127.0.0.1:%d/metrics/job/test' % self.server.server_address[1]
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    def _request(self, handler):
+        handler(url=self.url, method='POST', timeout=5, headers=[('Content-Type', 'text/plain')], data=b'data')()
+
+    def testReuse(self):
+        handler = KeepAliveHandler()
+
+        for _ in range(random.number(2, 20)):
+            self._request(handler)
+
+        self.assertEqual(self.server.connections, 1)
+        handler.close()
+
+    def testReconnect(self):
+        handler = KeepAliveHandler()
+
+        for i in range(random.number(2, 10)):
+            self._request(handler)
+            handler.close()
+            self.assertEqual(self.server.connections, i + 1)
+
+    def testErrorCode(self):
+        self.server.code = 500
+        handler = KeepAliveHandler()
+
+        with self.assertRaises(IOError):
+            self._request(handler)
+
+class ReporterPromethuesDrainTest(unittest.TestCase):
+    def testSize(self):
+        queue = multiprocessing.Queue()
+        count = random.number(5, 20)
+        for _ in range(count):
+            queue.put(random_args())
+
+        msgs, done = report_promethues.drain(queue, count - 2, interval=10)
+        self.assertEqual(len(msgs), count - 2)
+        self.assertFalse(done)
+
+        msgs, done = report_promethues.drain(queue, count, interval=0.1)
+        self.assertEqual(len(msgs), 2)
+        self.assertFalse(done)
+
+    def testFinish(self):
+        queue = multiprocessing.Queue()
+        queue.put(random_args())
+        queue.put(None)
+
+        msgs, done = report_promethues.drain(queue, 10, interval=10)
+        self.assertEqual(len(msgs), 1)
+        self.assertTrue(done)
 
 class ReporterPromethuesReporterTest(ReporterPromethuesBaseTest):
     def testCreationManual(self):
@@ -140,6 +369,148 @@ class ReporterPromethuesReporterTest(ReporterPromethuesBaseTest):
                 except:
                     self.fail('`finish` was not expected to raise an error')
 
+class ReporterPromethuesThreadTest(ReporterPromethuesBaseTest):
+    def testCreation(self):
+        for daemon in [True, False]:
+            reporter = Reporter(backend=report_promethues.Backend.thread)
+
+            reporter.start(daemon=daemon)
+            self.assertEqual(reporter.pid, os.getpid())
+            self.assertEqual(reporter.daemon, daemon)
+            reporter.finish()
+
+    def testEnvironment(self):
+        os.environ[report_promethues.BACKEND_KEY] = 'thread'
+
+        try:
+            self.assertIs(Reporter().backend, report_promethues.Backend.thread)
+            self.assertIs(Reporter(backend='process').backend, report_promethues.Backend.process)
+        finally:
+            del os.environ[report_promethues.BACKEND_KEY]
+
+        self.assertIs(Reporter().backend, report_promethues.Backend.process)
+
+    def testSend(self):
+        for maxsize in [0, random.number()]:
+            with Mock() as mock:
+                with Reporter(maxsize=maxsize, backend='thread') as reporter:
+                    count = random.number(2, 20)
+                    for _ in range(count):
+                        reporter.send(random_args())
+
+                self.assertGreaterEqual(mock.count, 1)
+                self.assertEqual(reporter.counters.pushed, count)
+
+    def testSendError(self):
+        for error in [IOError, ImportError, IndexError, KeyError, ValueError]:
+            with Mock(error):
+                with Reporter(backend='thread') as reporter:
+                    for _ in range(random.number(2, 20)):
+                        reporter.send(random_args())
+
+class ReporterPromethuesReportManyTest(ReporterPromethuesBaseTest):
+    def _dicts(self):
+        metrics = { 'metric_%d' % i: random.number() for i in range(random.number(2, 20)) }
+        parameters = { 'parameter_%d' % i: random.string() for i in range(random.number(2, 20)) }
+        return metrics, parameters
+
+    def testPack(self):
+        metrics, parameters = self._dicts()
+        msg = report_promethues.pack(metrics, parameters)
+
+        self.assertEqual(len(msg), len(metrics) + len(parameters))
+        self.assertEqual(report_promethues.unpack([msg, random_args()])[:len(msg)], msg)
+        self.assertEqual(report_promethues.pack(), [])
+
+    def testSingleMessage(self):
+        metrics, parameters = self._dicts()
+
+        class Send(Hook):
+            def __init__(self, reporter):
+                super(Send, self).__init__(reporter, 'send')
+                self.count = 0
+
+            def __hook__(self, msg):
+                self.count += 1
+                self.__original__(msg)
+
+        with Mock() as mock:
+            with Reporter(backend='thread') as reporter:
+                with Send(reporter) as send:
+                    reporter.report_many(metrics, parameters)
+
+                self.assertEqual(send.count, 1)
+
+            self.assertEqual(mock.count, 1)
+            self.assertEqual(reporter.counters.pushed, len(metrics) + len(parameters))
+
+    def testOverflow(self):
+        metrics, parameters = self._dicts()
+
+        reporter = Reporter(maxsize=1, overflow=report_promethues.Overflow.drop_newest)
+        reporter.report_many(metrics)
+        reporter.report_many(metrics, parameters)
+        self.assertEqual(reporter.counters.dropped, len(metrics) + len(parameters))
+
+        reporter = Reporter(maxsize=1, overflow=report_promethues.Overflow.coalesce)
+        reporter.report_many(metrics)
+        reporter.report_many(metrics, parameters)
+        reporter.report_many(metrics, parameters)
+        self.assertEqual(reporter.counters.coalesced, len(metrics) + len(parameters))
+
+    def testModule(self):
+        metrics, parameters = self._dicts()
+
+        with Mock():
+            report_promethues.report_many(metrics, parameters)
+            self.assertIsNotNone(report_promethues.REPORTER)
+
+            report_promethues.finish()
+            self.assertIsNone(report_promethues.REPORTER)
+
+class ReporterPromethuesOverflowTest(ReporterPromethuesBaseTest):
+    def _send(self, reporter, count):
+        for _ in range(count):
+            reporter.send(random_args())
+
+    def testUnbounded(self):
+        reporter = Reporter()
+        self._send(reporter, random.number())
+        self.assertEqual(reporter.counters.dropped, 0)
+
+    def testDrop(self):
+        for overflow in [report_promethues.Overflow.drop_oldest, report_promethues.Overflow.drop_newest]:
+            maxsize = random.number(2, 10)
+            count = random.number(maxsize + 1, 50)
+
+            reporter = Reporter(maxsize=maxsize, overflow=overflow)
+            self._send(reporter, count)
+            self.assertEqual(reporter.counters.dropped, count - maxsize)
+
+    def testCoalesce(self):
+        reporter = Reporter(maxsize=1, overflow=report_promethues.Overflow.coalesce)
+        self._send(reporter, 1)
+
+        name = random.string(chars=string.ascii_letters)
+        count = random.number(2, 20)
+        for value in range(count):
+            reporter.reportMetric(name, value)
+
+        self.assertEqual(reporter.counters.coalesced, count - 1)
+        self.assertEqual(list(reporter._pending.values()), [(name, count - 1, report_promethues.ReportType.metric)])
+
+    def testCounters(self):
+        count = random.number()
+
+        with Mock():
+            with Reporter(maxsize=1, overflow=report_promethues.Overflow.coalesce) as reporter:
+                name = random.string(chars=string.ascii_letters)
+                for value in range(count):
+                    reporter.reportMetric(name, value)
+
+        self.assertEqual(reporter.counters.dropped, 0)
+        self.assertEqual(reporter.counters.pushed + reporter.counters.coalesced, count)
+
 class ReporterPromethuesModuleTest(ReporterPromethuesBaseTest):
     def tearDown(self):
         super(ReporterPromethuesModuleTest, self).tearDown()
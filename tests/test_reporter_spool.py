@@ -0,0 +1,109 @@
+import os
+import string
+import tempfile
+import unittest
+
+from runai.utils import random
+from runai.reporter import report_promethues, spool, Reporter, Spool
+from runai.reporter.sink import Discard
+
+from test_reporter_promethues import Mock, ReporterPromethuesBaseTest, random_args
+
+class SpoolTest(ReporterPromethuesBaseTest):
+    def setUp(self):
+        fd, self.path = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        super(SpoolTest, self).tearDown()
+        os.remove(self.path)
+
+    def _reports(self):
+        return [(random.string(chars=string.ascii_letters), random.number(), report_promethues.ReportType.metric) for _ in range(random.number(2, 20))] + \
+               [(random.string(chars=string.ascii_letters), random.string(), report_promethues.ReportType.parameter) for _ in range(random.number(2, 20))]
+
+    def testSanity(self):
+        sink = Spool(self.path)
+        reports = self._reports()
+
+        self.assertEqual(sink.push(reports), len(reports))
+        self.assertEqual(sink.push([]), 0)
+        self.assertEqual(sink.push(reports), len(reports))
+        sink.close()
+
+        self.assertEqual(spool.read(self.path), reports * 2)
+
+    def testTornLine(self):
+        sink = Spool(self.path)
+        reports = self._reports()
+        sink.push(reports)
+        sink.close()
+
+        with open(self.path, 'a') as f:
+            f.write('{"name": "tor')
+
+        self.assertEqual(spool.read(self.path), reports)
+
+    def testInvalidValue(self):
+        sink = Spool(self.path)
+        reports = [
+            ('good', 1, report_promethues.ReportType.metric),
+            ('bad', 'value', report_promethues.ReportType.metric),
+            ('after', 3, report_promethues.ReportType.metric),
+        ]
+
+        self.assertEqual(sink.push(reports), 2)
+        sink.close()
+
+        self.assertEqual(spool.read(self.path), [('good', 1., report_promethues.ReportType.metric), ('after', 3., report_promethues.ReportType.metric)])
+
+    def testReporter(self):
+        for backend in report_promethues.Backend:
+            count = random.number(2, 20)
+
+            with Reporter(backend=backend, sink=Spool(self.path)) as reporter:
+                for _ in range(count):
+                    reporter.send(random_args())
+
+            self.assertEqual(len(spool.read(self.path)), count)
+            os.truncate(self.path, 0)
+
+    def testEnvironment(self):
+        os.environ[report_promethues.SPOOL_PATH_KEY] = self.path
+
+        try:
+            self.assertIsInstance(report_promethues.default_sink(), Spool)
+
+            with Reporter() as reporter:
+                reporter.report_many(metrics={ 'loss': 0.5 })
+        finally:
+            del os.environ[report_promethues.SPOOL_PATH_KEY]
+
+        self.assertIsInstance(report_promethues.default_sink(), report_promethues.Pushgateway)
+        self.assertEqual(spool.read(self.path), [('loss', 0.5, report_promethues.ReportType.metric)])
+
+    def testMissingEnvironment(self):
+        environ = { key: os.environ.pop(key) for key in [report_promethues.GATEWAY_URL_KEY, report_promethues.GROUPING_KEY] }
+
+        try:
+            self.assertIsInstance(report_promethues.default_sink(), Discard)
+
+            with Reporter(backend='thread') as reporter:
+                reporter.report_many(metrics={ 'loss': 0.5 })
+
+            self.assertEqual(reporter.counters.pushed, 0)
+        finally:
+            os.environ.update(environ)
+
+    def testReplay(self):
+        sink = Spool(self.path)
+        reports = self._reports()
+        sink.push(reports)
+        sink.close()
+
+        with Mock() as mock:
+            self.assertEqual(spool.replay(self.path), len(reports))
+            self.assertEqual(mock.count, 1)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,8 @@
+import os
 import random
+import shutil
 import sys
+import tempfile
 import unittest
 
 import runai.utils
@@ -167,6 +170,57 @@ class TestAttribute(unittest.TestCase):
         assert not hasattr(obj, old)
         assert getattr(obj, new) == value
 
+class TestFlock(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.path = os.path.join(self.root, 'lock')
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_shared(self):
+        with runai.utils.Flock(self.path, shared=True):
+            with runai.utils.Flock(self.path, shared=True, timeout=0) as flock:
+                assert flock.acquisitions == 1
+
+            with self.assertRaises(TimeoutError):
+                runai.utils.Flock(self.path, timeout=0).acquire()
+
+    def test_exclusive(self):
+        with runai.utils.Flock(self.path):
+            for shared in [True, False]:
+                with self.assertRaises(TimeoutError):
+                    runai.utils.Flock(self.path, shared=shared, timeout=0).acquire()
+
+        with runai.utils.Flock(self.path, timeout=0):
+            pass
+
+    def test_timeout(self):
+        flock = runai.utils.Flock(self.path, timeout=0.1)
+
+        with runai.utils.Flock(self.path):
+            with self.assertRaises(TimeoutError):
+                flock.acquire()
+
+        assert flock.acquisitions == 0
+
+        flock.acquire(shared=True)
+        flock.release()
+
+        assert flock.acquisitions == 1
+        assert flock.waited < 0.1
+        assert flock.total == flock.waited
+
+    def test_not_truncated(self):
+        with open(self.path, 'w') as f:
+            f.write('content')
+
+        with runai.utils.Flock(self.path):
+            pass
+
+        with open(self.path, 'r') as f:
+            assert f.read() == 'content'
+
 class TestGPUs(unittest.TestCase):
     def test_not_available(self):
         assert not runai.utils.gpus.available()